@@ -16,10 +16,16 @@ Items with block bodies (ending with `}`) are left unchanged:
 Usage:
     python3 scripts/add_item_semicolons.py tests/
     python3 scripts/add_item_semicolons.py tests/spec/types/primitives.ori
+    python3 scripts/add_item_semicolons.py --dry-run --jobs 8 tests/ docs/
 """
 
+import argparse
+import io
 import os
+import re
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
 
 # Keywords/operators that indicate the expression continues on the next line
 CONTINUATION_ENDINGS = (
@@ -29,48 +35,59 @@ CONTINUATION_ENDINGS = (
     "??", "=", ",", "(",
 )
 
+# Line heads that start a new top-level declaration (`#` for attributes)
+DECL_START_RE = re.compile(
+    r"@|\$|#|let \$|(?:type|trait|impl|def impl|extend|use|pub|extension|extern|capset) "
+)
+
+# Line heads of the items whose expression bodies need a trailing `;`
+ITEM_DECL_RE = re.compile(r"(?:pub )?(?:@|type )")
+
+# File name suffixes of the files to process
+ORI_SUFFIXES = (".ori", ".ori.expected")
+
+# Read/write buffer large enough to move a whole test file in one syscall
+IO_BUFFER_SIZE = 1 << 20
+
+# CONTINUATION_ENDINGS grouped by last char, so a line is only checked
+# against the endings that can match it
+ENDINGS_BY_LAST_CHAR = {
+    last: tuple(e for e in CONTINUATION_ENDINGS if e[-1] == last)
+    for last in {e[-1] for e in CONTINUATION_ENDINGS}
+}
+
+
+def leading_ws(line: str) -> int:
+    """Get the length of a line's leading whitespace.
+
+    Predicates take this offset instead of an `lstrip()`ed copy of the line.
+    """
+    return len(line) - len(line.lstrip())
 
-def is_comment_line(line: str) -> bool:
+
+def is_comment_line(line: str, ws: int) -> bool:
     """Check if a line is a comment (ignoring leading whitespace)."""
-    return line.lstrip().startswith("//")
+    return line.startswith("//", ws)
 
 
-def is_declaration_start(line: str) -> bool:
+def is_declaration_start(line: str, ws: int) -> bool:
     """Check if a line starts a new top-level declaration."""
-    stripped = line.lstrip()
-    return (
-        stripped.startswith("@")
-        or stripped.startswith("type ")
-        or stripped.startswith("trait ")
-        or stripped.startswith("impl ")
-        or stripped.startswith("def impl ")
-        or stripped.startswith("extend ")
-        or stripped.startswith("use ")
-        or stripped.startswith("pub ")
-        or stripped.startswith("extension ")
-        or stripped.startswith("extern ")
-        or stripped.startswith("let $")
-        or stripped.startswith("$")
-        or stripped.startswith("#")  # attributes
-        or stripped.startswith("capset ")
-    )
+    return DECL_START_RE.match(line, ws) is not None
 
 
-def line_continues(line: str) -> bool:
+@lru_cache(maxsize=4096)
+def line_continues(stripped: str) -> bool:
     """Check if a line's expression continues on the next line.
 
-    True if the line ends with an operator/keyword that expects a right-hand side.
+    True if the line (without trailing whitespace) ends with an
+    operator/keyword that expects a right-hand side.
     """
-    stripped = line.rstrip()
     if not stripped:
         return False
-    for ending in CONTINUATION_ENDINGS:
-        if stripped.endswith(ending):
-            return True
-    return False
+    return stripped.endswith(ENDINGS_BY_LAST_CHAR.get(stripped[-1], ()))
 
 
-def next_line_is_continuation(lines: list, idx: int) -> bool:
+def next_line_is_continuation(lines: list, ws_idx: list, idx: int) -> bool:
     """Check if the line at `idx` is a continuation of the previous expression.
 
     True if the line starts with `.` (method chain) or is indented
@@ -78,48 +95,74 @@ def next_line_is_continuation(lines: list, idx: int) -> bool:
     """
     if idx >= len(lines):
         return False
-    stripped = lines[idx].lstrip()
-    if not stripped or stripped.startswith("//"):
+    line = lines[idx]
+    ws = ws_idx[idx]
+    if not line or line.startswith("//", ws):
         return False
     # Method chain continuation: .method(...)
-    if stripped.startswith("."):
+    if line.startswith(".", ws):
         return True
     # Operator continuation at start of indented line
-    if lines[idx][0] in (" ", "\t") and stripped[0] in ("|", "&", "+", "-"):
+    if line[0] in (" ", "\t") and line[ws] in ("|", "&", "+", "-"):
         return True
     # else continuation (if/then/else chains)
-    if stripped.startswith("else"):
+    if line.startswith("else", ws):
         return True
     return False
 
 
-def find_eq_in_decl(line: str) -> int:
-    """Find the `=` that introduces a declaration body.
+def fold_depth(line: str, lo: int, hi: int, depth: int) -> int:
+    """Fold `line[lo:hi]`, scanned right to left, into a closing-delimiter depth.
 
-    Returns the index of `=` in the line, or -1 if not found.
-    Skips `=` inside comparison/compound operators.
+    Closers increment the depth; openers decrement it, never below 0.
     """
-    i = len(line) - 1
-    depth = 0
-    while i >= 0:
+    closers = line.count(")", lo, hi) + line.count("]", lo, hi) + line.count("}", lo, hi)
+    openers = line.count("(", lo, hi) + line.count("[", lo, hi) + line.count("{", lo, hi)
+    if not openers:
+        return depth + closers
+    if not closers:
+        return max(0, depth - openers)
+    for i in range(hi - 1, lo - 1, -1):
         ch = line[i]
         if ch in (")", "]", "}"):
             depth += 1
         elif ch in ("(", "[", "{"):
             depth = max(0, depth - 1)
-        elif ch == "=" and depth == 0:
-            if i > 0 and line[i - 1] in ("=", "!", "<", ">", "."):
-                i -= 1
-                continue
-            if i + 1 < len(line) and line[i + 1] in ("=", ">"):
-                i -= 1
-                continue
-            return i
-        i -= 1
-    return -1
-
-
-def find_expression_end(lines: list, start_idx: int, after_eq: str) -> int:
+    return depth
+
+
+def find_eq_in_decl(line: str) -> int:
+    """Find the `=` that introduces a declaration body.
+
+    Returns the index of `=` in the line, or -1 if not found.
+    Skips `=` inside comparison/compound operators.
+    """
+    depth = 0
+    pos = len(line)
+    while True:
+        eq = line.rfind("=", 0, pos)
+        if eq == -1:
+            return -1
+        depth = fold_depth(line, eq + 1, pos, depth)
+        pos = eq
+        if depth:
+            continue
+        if eq > 0 and line[eq - 1] in ("=", "!", "<", ">", "."):
+            continue
+        if eq + 1 < len(line) and line[eq + 1] in ("=", ">"):
+            continue
+        return eq
+
+
+def depth_delta(text: str) -> int:
+    """Get the net delimiter depth change (parens, brackets, braces) over `text`."""
+    return (
+        text.count("(") + text.count("[") + text.count("{")
+        - text.count(")") - text.count("]") - text.count("}")
+    )
+
+
+def find_expression_end(lines: list, ws_idx: list, start_idx: int, after_eq: str) -> int:
     """Find the index of the LAST line of a declaration's expression body.
 
     Starts from `start_idx` (the declaration line) and walks forward,
@@ -129,17 +172,14 @@ def find_expression_end(lines: list, start_idx: int, after_eq: str) -> int:
     - Operator continuations (line ends with operator/keyword)
     - Blank lines / next declarations as terminators
 
+    `lines` are the file's lines without trailing whitespace.
+
     Returns the index of the last line of the expression body.
     """
     n = len(lines)
 
     # Track delimiter depth in the expression
-    depth = 0
-    for ch in after_eq:
-        if ch in ("(", "[", "{"):
-            depth += 1
-        elif ch in (")", "]", "}"):
-            depth -= 1
+    depth = depth_delta(after_eq)
 
     current = start_idx
 
@@ -149,11 +189,7 @@ def find_expression_end(lines: list, start_idx: int, after_eq: str) -> int:
             current += 1
             if current >= n:
                 break
-            for ch in lines[current]:
-                if ch in ("(", "[", "{"):
-                    depth += 1
-                elif ch in (")", "]", "}"):
-                    depth -= 1
+            depth += depth_delta(lines[current])
             continue
 
         # Delimiters are balanced. Check if expression continues:
@@ -163,24 +199,16 @@ def find_expression_end(lines: list, start_idx: int, after_eq: str) -> int:
             current += 1
             if current >= n:
                 break
-            for ch in lines[current]:
-                if ch in ("(", "[", "{"):
-                    depth += 1
-                elif ch in (")", "]", "}"):
-                    depth -= 1
+            depth += depth_delta(lines[current])
             continue
 
         # 2. Next non-blank line is a method chain or operator continuation
         peek = current + 1
-        while peek < n and lines[peek].strip() == "":
+        while peek < n and not lines[peek]:
             peek += 1
-        if peek < n and next_line_is_continuation(lines, peek):
+        if peek < n and next_line_is_continuation(lines, ws_idx, peek):
             current = peek
-            for ch in lines[current]:
-                if ch in ("(", "[", "{"):
-                    depth += 1
-                elif ch in (")", "]", "}"):
-                    depth -= 1
+            depth += depth_delta(lines[current])
             continue
 
         # Expression is complete
@@ -189,12 +217,12 @@ def find_expression_end(lines: list, start_idx: int, after_eq: str) -> int:
     return current
 
 
-def needs_semicolon(line: str) -> bool:
+def needs_semicolon(stripped: str) -> bool:
     """Check if a line ends an expression body that needs `;`.
 
-    Returns True if the line doesn't already end with `;`, `}`, `,`, or `{`.
+    Returns True if the line (without trailing whitespace) doesn't already
+    end with `;`, `}`, `,`, or `{`.
     """
-    stripped = line.rstrip()
     if not stripped:
         return False
     return stripped[-1] not in (";", "}", "{", ",", "(", "[")
@@ -205,33 +233,31 @@ def process_file(filepath: str, dry_run: bool = False) -> int:
 
     Returns the number of semicolons added.
     """
-    with open(filepath, "r") as f:
-        lines = f.readlines()
+    with open(filepath, "r", buffering=IO_BUFFER_SIZE) as f:
+        content = f.read()
+
+    # Fast negative: every item this script touches starts with `@` or `type `
+    if "@" not in content and "type " not in content:
+        return 0
 
+    lines = io.StringIO(content).readlines()
+
+    # Analysis runs on each line's rstrip()ed text, computed once; `lines`
+    # keeps the original text and receives the added semicolons
+    stripped = [line.rstrip() for line in lines]
+    ws_idx = [leading_ws(line) for line in stripped]
     changes = 0
-    result = []
     i = 0
     n = len(lines)
-    # Track which line indices get `;` appended (computed in first pass)
-    semicolon_lines = set()
 
-    # --- First pass: identify which lines need `;` ---
     while i < n:
-        line = lines[i]
+        line = stripped[i]
 
-        if is_comment_line(line):
+        if is_comment_line(line, ws_idx[i]):
             i += 1
             continue
 
-        stripped = line.lstrip()
-        is_decl = (
-            stripped.startswith("@")
-            or stripped.startswith("pub @")
-            or stripped.startswith("type ")
-            or stripped.startswith("pub type ")
-        )
-
-        if not is_decl:
+        if not ITEM_DECL_RE.match(line, ws_idx[i]):
             i += 1
             continue
 
@@ -253,82 +279,123 @@ def process_file(filepath: str, dry_run: bool = False) -> int:
             if i < n:
                 # Check if next non-blank line starts with `{`
                 peek = i
-                while peek < n and lines[peek].strip() == "":
+                while peek < n and not stripped[peek]:
                     peek += 1
-                if peek < n and lines[peek].lstrip().startswith("{"):
+                if peek < n and stripped[peek].startswith("{", ws_idx[peek]):
                     i = peek + 1
                     continue
                 # Find the end of the multi-line expression body
-                end_idx = find_expression_end(lines, i, lines[i] if i < n else "")
-                if needs_semicolon(lines[end_idx]):
-                    semicolon_lines.add(end_idx)
+                end_idx = find_expression_end(stripped, ws_idx, i, stripped[i])
+                if needs_semicolon(stripped[end_idx]):
+                    lines[end_idx] = lines[end_idx].rstrip("\n") + ";\n"
+                    changes += 1
                 i = end_idx + 1
             continue
 
         # Expression body on same line as `=`
-        end_idx = find_expression_end(lines, i, after_eq)
+        end_idx = find_expression_end(stripped, ws_idx, i, after_eq)
 
-        if end_idx == i:
-            # Single-line expression
-            if needs_semicolon(line):
-                semicolon_lines.add(i)
-        else:
-            # Multi-line expression
-            if needs_semicolon(lines[end_idx]):
-                semicolon_lines.add(end_idx)
+        # Single- or multi-line expression: `;` goes after its last line
+        if needs_semicolon(stripped[end_idx]):
+            lines[end_idx] = lines[end_idx].rstrip("\n") + ";\n"
+            changes += 1
 
         i = end_idx + 1
 
-    # --- Second pass: apply changes ---
-    for i, line in enumerate(lines):
-        if i in semicolon_lines:
-            result.append(line.rstrip("\n") + ";\n")
-            changes += 1
-        else:
-            result.append(line)
-
     if changes > 0 and not dry_run:
-        with open(filepath, "w") as f:
-            f.writelines(result)
+        with open(filepath, "w", buffering=IO_BUFFER_SIZE) as f:
+            f.write("".join(lines))
 
     return changes
 
 
-def process_directory(dirpath: str, dry_run: bool = False) -> int:
-    """Process all .ori files in a directory tree."""
-    total = 0
-    for root, _, files in sorted(os.walk(dirpath)):
-        for fname in sorted(files):
-            if fname.endswith(".ori") or fname.endswith(".ori.expected"):
-                filepath = os.path.join(root, fname)
-                changes = process_file(filepath, dry_run=dry_run)
-                if changes > 0:
-                    print(f"  {filepath}: {changes} semicolons added")
-                    total += changes
-    return total
+def walk_ori_files(dirpath: str):
+    """Yield the path of every .ori file in a directory tree as it is scanned.
 
+    Like `os.walk`, symlinked directories are not descended into and
+    unreadable directories are skipped.
+    """
+    pending = [dirpath]
+    while pending:
+        root = pending.pop()
+        try:
+            entries = os.scandir(root)
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir():
+                    if not entry.is_symlink():
+                        pending.append(entry.path)
+                elif entry.name.endswith(ORI_SUFFIXES):
+                    yield entry.path
 
-def main():
-    if len(sys.argv) < 2:
-        print("Usage: python3 scripts/add_item_semicolons.py [--dry-run] <path>...")
-        sys.exit(1)
 
-    dry_run = "--dry-run" in sys.argv
-    paths = [p for p in sys.argv[1:] if p != "--dry-run"]
+def collect_files(paths: list[str]):
+    """Yield every file named by `paths` once.
 
-    total = 0
+    Files are yielded as given; directories are walked for .ori files.
+    """
+    seen = set()
     for path in paths:
         if os.path.isfile(path):
-            changes = process_file(path, dry_run=dry_run)
-            if changes > 0:
-                print(f"  {path}: {changes} semicolons added")
-                total += changes
+            found = (path,)
         elif os.path.isdir(path):
-            total += process_directory(path, dry_run=dry_run)
+            found = walk_ori_files(path)
         else:
             print(f"Warning: {path} not found", file=sys.stderr)
+            continue
+        for filepath in found:
+            if filepath not in seen:
+                seen.add(filepath)
+                yield filepath
+
+
+def process_path(filepath: str, dry_run: bool = False) -> tuple[str, int]:
+    """Process a single .ori file, returning its path and semicolons added."""
+    return filepath, process_file(filepath, dry_run=dry_run)
+
+
+def process_paths(paths: list[str], dry_run: bool = False, jobs: int | None = None) -> int:
+    """Process all files named by `paths` across one shared process pool.
+
+    Files are independent, so they are handed to the pool while directory
+    trees are still being scanned; results are reported in sorted order.
+    Returns the total number of semicolons added.
+    """
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        results = list(pool.map(
+            partial(process_path, dry_run=dry_run), collect_files(paths), chunksize=64
+        ))
+
+    total = 0
+    for filepath, changes in sorted(results, key=lambda r: os.path.split(r[0])):
+        if changes > 0:
+            print(f"  {filepath}: {changes} semicolons added")
+            total += changes
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Add trailing semicolons to expression-body items in .ori files"
+    )
+    parser.add_argument("paths", nargs="+", help="Files or directories to process")
+    parser.add_argument("--dry-run", action="store_true", help="Count semicolons without writing")
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of worker processes (default: CPU count)",
+    )
+    args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+
+    total = process_paths(args.paths, dry_run=args.dry_run, jobs=args.jobs)
 
-    action = "would add" if dry_run else "added"
+    action = "would add" if args.dry_run else "added"
     print(f"\nTotal: {action} {total} semicolons")
 
 
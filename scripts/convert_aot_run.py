@@ -8,59 +8,19 @@ IMPORTANT: Processes innermost run() first to avoid corrupting
 nested blocks with incorrect semicolons.
 """
 
+import re
 import sys
+from bisect import bisect_right
 
-
-def find_matching_paren(s: str, start: int) -> int:
-    """Find the closing paren matching the opening paren at `start`."""
-    depth = 0
-    i = start
-    while i < len(s):
-        c = s[i]
-        if c == '(':
-            depth += 1
-        elif c == ')':
-            depth -= 1
-            if depth == 0:
-                return i
-        elif c == '"':
-            # Skip string literals
-            i += 1
-            while i < len(s) and s[i] != '"':
-                if s[i] == '\\':
-                    i += 1  # skip escaped char
-                i += 1
-        elif c == "'":
-            # Skip char literals (e.g., 'a')
-            i += 1
-            if i < len(s) and s[i] == '\\':
-                i += 1  # skip escaped char
-            i += 1  # skip the char
-            # Don't skip closing quote — loop will advance
-        i += 1
-    return -1
-
-
-def find_matching_brace(s: str, start: int) -> int:
-    """Find the closing brace matching the opening brace at `start`."""
-    depth = 0
-    i = start
-    while i < len(s):
-        c = s[i]
-        if c == '{':
-            depth += 1
-        elif c == '}':
-            depth -= 1
-            if depth == 0:
-                return i
-        elif c == '"':
-            i += 1
-            while i < len(s) and s[i] != '"':
-                if s[i] == '\\':
-                    i += 1
-                i += 1
-        i += 1
-    return -1
+# Call heads (`keyword(` not part of a larger word), per keyword
+CALL_HEAD_RES = {kw: re.compile(rf'\b{kw}\(') for kw in ('run', 'loop')}
+# Chars that matter when scanning inside a call: parens and literal quotes
+CALL_CHARS_RE = re.compile(r'[()"\']')
+# Chars that matter inside a string literal: its closing quote and escapes
+STRING_CHARS_RE = re.compile(r'["\\]')
+# Trailing whitespace / trailing comma of each line in a run() body
+TRAILING_WS_RE = re.compile(r'[^\S\n]+$', re.M)
+TRAILING_COMMA_RE = re.compile(r',$', re.M)
 
 
 def convert_run_body(body: str) -> str:
@@ -69,159 +29,189 @@ def convert_run_body(body: str) -> str:
     The last non-empty line's trailing comma is REMOVED (it's the result expression).
     All other trailing commas become semicolons.
     """
-    lines = body.split('\n')
+    # The last non-empty line ends where the body's trailing whitespace starts
+    end = len(body.rstrip())
+    last_line = body.rfind('\n', 0, end) + 1
 
-    # Find last non-empty line
-    last_nonempty = -1
-    for i in range(len(lines) - 1, -1, -1):
-        if lines[i].strip():
-            last_nonempty = i
-            break
+    statements = TRAILING_WS_RE.sub('', body[:last_line])
+    statements = TRAILING_COMMA_RE.sub(';', statements)
 
-    result = []
-    for i, line in enumerate(lines):
-        stripped = line.rstrip()
-        if i == last_nonempty and stripped.endswith(','):
-            # Last statement: remove trailing comma (it's the result expression)
-            result.append(stripped[:-1])
-        elif stripped.endswith(',') and i < last_nonempty:
-            # Non-last statement: comma -> semicolon
-            result.append(stripped[:-1] + ';')
-        else:
-            result.append(stripped if stripped else '')
+    result = body[last_line:end]
+    if result.endswith(','):
+        # Last statement: remove trailing comma (it's the result expression)
+        result = result[:-1]
 
-    return '\n'.join(result)
+    # Blank lines after the result expression keep only their newlines
+    return statements + result + '\n' * body.count('\n', end)
 
 
-def find_innermost_run(content: str) -> tuple[int, int] | None:
-    """Find the innermost run() — one whose body contains no other run().
+def skip_literal(s: str, i: int) -> int:
+    """Skip the string or char literal opening at `i`.
 
-    Returns (start_of_run, end_of_closing_paren) or None.
+    Returns the index of the literal's last char (its closing quote).
     """
-    pos = 0
-    candidates = []
+    if s[i] == '"':
+        i += 1
+        while True:
+            m = STRING_CHARS_RE.search(s, i)
+            if m is None:
+                return len(s)
+            if m.group() == '"':
+                return m.start()
+            i = m.start() + 2  # skip escaped char
+    # Char literal (e.g., 'a')
+    i += 1
+    if i < len(s) and s[i] == '\\':
+        i += 1  # skip escaped char
+    return i + 1
+
+
+def newline_offsets(content: str) -> list[int]:
+    """Get -1 followed by the offset of every newline in `content`."""
+    offsets = [-1]
+    nl = content.find('\n')
+    while nl != -1:
+        offsets.append(nl)
+        nl = content.find('\n', nl + 1)
+    return offsets
+
+
+def line_start(nl_offsets: list[int], idx: int) -> int:
+    """Get the start offset of the line containing position `idx`."""
+    return nl_offsets[bisect_right(nl_offsets, idx - 1) - 1] + 1
+
+
+def get_indent(content: str, start: int, cache: dict[int, str]) -> str:
+    """Get the indentation of the line of `content` starting at `start`."""
+    indent = cache.get(start)
+    if indent is None:
+        end = start
+        while end < len(content) and content[end] in ' \t':
+            end += 1
+        indent = cache[start] = content[start:end]
+    return indent
 
-    while pos < len(content):
-        idx = content.find('run(', pos)
-        if idx == -1:
-            break
 
-        # Check it's not part of a larger word
-        if idx > 0 and (content[idx - 1].isalnum() or content[idx - 1] == '_'):
-            pos = idx + 4
-            continue
+def output_indent(chunks: list[str]) -> str:
+    """Get the indentation of the line being written at the end of `chunks`."""
+    tail = []
+    for chunk in reversed(chunks):
+        nl = chunk.rfind('\n')
+        if nl != -1:
+            tail.append(chunk[nl + 1:])
+            break
+        tail.append(chunk)
+    line = ''.join(reversed(tail))
+    return line[:len(line) - len(line.lstrip(' \t'))]
 
-        paren_start = idx + 3
-        paren_end = find_matching_paren(content, paren_start)
-        if paren_end == -1:
-            pos = idx + 4
-            continue
 
-        body = content[paren_start + 1:paren_end]
-        candidates.append((idx, paren_end, body))
-        pos = idx + 4
-
-    # Find the innermost: one whose body doesn't contain another run(
-    for idx, paren_end, body in candidates:
-        # Check if body contains another run( (that isn't part of a word)
-        has_nested = False
-        bpos = 0
-        while bpos < len(body):
-            bidx = body.find('run(', bpos)
-            if bidx == -1:
-                break
-            if bidx > 0 and (body[bidx - 1].isalnum() or body[bidx - 1] == '_'):
-                bpos = bidx + 4
-                continue
-            has_nested = True
-            break
+def rewrite_calls(content: str, keyword: str, rewrite) -> str:
+    """Rewrite every `keyword(...)` call in a single left-to-right scan.
 
-        if not has_nested:
-            return (idx, paren_end)
+    A call is rewritten when its closing paren is reached, so calls are
+    always rewritten innermost-first and an outer call's body already holds
+    the rewritten form of its nested calls. `rewrite(body, indent)` gets the
+    text between the parens plus the indentation of the line the call starts
+    on, and returns the replacement for the whole call.
 
-    return None
+    Parens and literals are only tracked inside a call, matching a paren
+    scan that starts at the call's opening paren. Unclosed calls are kept
+    as-is.
+    """
+    out = []
+    # One entry per open paren: (index in `out` of the call's head chunk,
+    # indent, call start) for `keyword(` parens, None for any other paren.
+    stack = []
+    head = keyword + '('
+    head_re = CALL_HEAD_RES[keyword]
+    start = 0  # first index of `content` not yet copied to `out`
+    last_end = 0  # end of the most recently rewritten call
+    nl_offsets = newline_offsets(content)
+    indent_cache = {}
+    i = 0
+    n = len(content)
+    while True:
+        m = (CALL_CHARS_RE if stack else head_re).search(content, i) if i < n else None
+        if m is None:
+            if not stack:
+                break
+            # Unclosed call: keep it verbatim and rescan right after its head
+            mark, _, call_start = stack[0]
+            del out[mark + 1:]
+            stack.clear()
+            i = start = call_start + len(head)
+            continue
 
+        i = m.start()
+        c = m.group()
+        if c == '(' and stack and head_re.match(content, i - len(keyword)):
+            i -= len(keyword)
+            c = head
+        if c == head:
+            out.append(content[start:i])
+            line = line_start(nl_offsets, i)
+            if line >= last_end:
+                indent = get_indent(content, line, indent_cache)
+            else:
+                # A rewritten call ends on this line, so it only exists in `out`
+                indent = output_indent(out)
+            stack.append((len(out), indent, i))
+            out.append(head)
+            i = start = m.end()
+            continue
 
-def get_indent(content: str, idx: int) -> str:
-    """Get the indentation of the line containing position `idx`."""
-    line_start = content.rfind('\n', 0, idx)
-    if line_start == -1:
-        line_start = -1
-    indent = ''
-    for c in content[line_start + 1:idx]:
-        if c in ' \t':
-            indent += c
+        if c == '(':
+            stack.append(None)
+        elif c == ')':
+            call = stack.pop()
+            if call is not None:
+                mark, indent, _ = call
+                out.append(content[start:i])
+                body = ''.join(out[mark + 1:])
+                del out[mark:]
+                out.append(rewrite(body, indent))
+                start = last_end = i + 1
         else:
-            break
-    return indent
+            i = skip_literal(content, i)
+        i += 1
 
+    out.append(content[start:])
+    return ''.join(out)
 
-def process_content(content: str) -> str:
-    """Process content, converting all run() blocks to {} blocks.
 
-    Processes innermost run() first to avoid corrupting nested blocks.
-    """
-    result = content
+def run_block(body: str, indent: str) -> str:
+    """Build the `{ }` block replacing a `run(body)` call."""
+    converted_body = convert_run_body(body)
+    if converted_body.startswith('\n'):
+        replacement = '{'
+    else:
+        replacement = '{ '
+    replacement += converted_body
+    if not converted_body.endswith('\n'):
+        replacement += '\n'
+    return replacement + indent + '}'
 
-    while True:
-        match = find_innermost_run(result)
-        if match is None:
-            break
 
-        idx, paren_end = match
-        paren_start = idx + 3
-        body = result[paren_start + 1:paren_end]
+def loop_expr(inner: str, indent: str) -> str:
+    """Build the paren-less `loop expr` replacing a `loop(expr)` call.
 
-        # Convert body: commas -> semicolons
-        converted_body = convert_run_body(body)
+    Covers loop(break 42) -> loop break 42 and loop({ ... }) -> loop { ... }.
+    """
+    return 'loop ' + inner.strip()
 
-        # Build replacement
-        indent = get_indent(result, idx)
 
-        if converted_body.startswith('\n'):
-            replacement = '{'
-        else:
-            replacement = '{ '
-        replacement += converted_body
-        if not converted_body.endswith('\n'):
-            replacement += '\n'
-        replacement += indent + '}'
+def process_content(content: str) -> str:
+    """Process content, converting all run() blocks to {} blocks.
 
-        result = result[:idx] + replacement + result[paren_end + 1:]
+    Processes innermost run() first to avoid corrupting nested blocks.
+    """
+    result = rewrite_calls(content, 'run', run_block)
 
     # Handle loop(expr) -> loop expr patterns
     # After run() conversion, we may have loop({ ... }) patterns
     # The loop() paren form was removed, so loop(break 42) -> loop break 42
     # and loop({ ... }) -> loop { ... }
-    import re
-
-    # loop(break ...) -> loop break ...
-    pos = 0
-    while pos < len(result):
-        m = re.search(r'loop\(', result[pos:])
-        if m is None:
-            break
-        loop_idx = pos + m.start()
-        paren_start = loop_idx + 4
-        paren_end = find_matching_paren(result, paren_start)
-        if paren_end == -1:
-            pos = loop_idx + 5
-            continue
-
-        inner = result[paren_start + 1:paren_end]
-
-        # Check if it's loop({ ... }) — remove outer parens
-        stripped = inner.strip()
-        if stripped.startswith('{') and stripped.endswith('}'):
-            # loop({ ... }) -> loop { ... }
-            result = result[:loop_idx] + 'loop ' + stripped + result[paren_end + 1:]
-        else:
-            # loop(expr) -> loop expr (simple case like loop(break 42))
-            result = result[:loop_idx] + 'loop ' + inner.strip() + result[paren_end + 1:]
-
-        pos = loop_idx + 5
-
-    return result
+    return rewrite_calls(result, 'loop', loop_expr)
 
 
 def main():
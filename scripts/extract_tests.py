@@ -17,9 +17,12 @@ Usage:
 from __future__ import annotations
 
 import argparse
+import json
+import mmap
 import os
 import re
 import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
 
@@ -45,6 +48,31 @@ class BraceMatchError(Exception):
     pass
 
 
+# Write buffer large enough to move a whole source file in one syscall
+IO_BUFFER_SIZE = 1 << 20
+
+# Threads used to overlap the file writes of --apply
+WRITE_THREADS = 16
+
+# Files last seen with no inline test module, mapped to their [mtime_ns, size]
+# so unchanged ones are skipped on the next run. It is stamped with this script's
+# own [mtime_ns, size] and discarded once the script (and so its rules) changes.
+# Delete it to rescan everything.
+SEEN_CACHE_PATH = Path(__file__).resolve().parent.parent / ".cache" / "extract_tests_seen.json"
+
+
+# Tokens find_matching_brace has to act on; everything between them is skipped.
+# A raw string opener is r or br, any number of #s, then a quote. The leading
+# lookahead lets the regex engine skip ahead by first character.
+BRACE_TOKEN_RE = re.compile(r"""(?=[{}"'/rb])(?:[{}"']|//|/\*|b?r(?P<hashes>#*)")""")
+
+# Nested block comment delimiters
+COMMENT_DELIM_RE = re.compile(r"/\*|\*/")
+
+# Characters that end or escape within a regular string literal
+STRING_SPECIAL_RE = re.compile(r'["\\]')
+
+
 def find_matching_brace(source: str, open_pos: int) -> int:
     """Find the matching closing brace for an opening brace at open_pos.
 
@@ -62,106 +90,80 @@ def find_matching_brace(source: str, open_pos: int) -> int:
     i = open_pos + 1
     length = len(source)
 
-    while i < length and depth > 0:
-        ch = source[i]
-
-        # Line comment
-        if ch == "/" and i + 1 < length and source[i + 1] == "/":
-            # Skip to end of line
-            newline = source.find("\n", i)
-            if newline == -1:
-                i = length
-            else:
-                i = newline + 1
-            continue
-
-        # Block comment (supports nesting)
-        if ch == "/" and i + 1 < length and source[i + 1] == "*":
-            i += 2
-            comment_depth = 1
-            while i < length and comment_depth > 0:
-                if source[i] == "/" and i + 1 < length and source[i + 1] == "*":
-                    comment_depth += 1
-                    i += 2
-                elif source[i] == "*" and i + 1 < length and source[i + 1] == "/":
-                    comment_depth -= 1
-                    i += 2
-                else:
-                    i += 1
-            continue
+    while True:
+        m = BRACE_TOKEN_RE.search(source, i)
+        if m is None:
+            break
+        token = m.group()
+        i = m.end()
 
-        # Raw string literal: r#"..."#, r##"..."##, br#"..."#, etc.
-        if ch in ("r", "b"):
-            raw_start = i
-            ri = i
-            # Skip optional 'b' prefix
-            if source[ri] == "b" and ri + 1 < length and source[ri + 1] == "r":
-                ri += 1
-            if source[ri] == "r":
-                # Count hashes
-                ri += 1
-                num_hashes = 0
-                while ri < length and source[ri] == "#":
-                    num_hashes += 1
-                    ri += 1
-                if ri < length and source[ri] == '"':
-                    # This is a raw string literal
-                    ri += 1  # skip opening quote
-                    # Find closing: "###
-                    closing = '"' + "#" * num_hashes
-                    end = source.find(closing, ri)
-                    if end == -1:
-                        raise BraceMatchError(
-                            f"Unterminated raw string literal starting at position {raw_start}"
-                        )
-                    i = end + len(closing)
-                    continue
-            # Not a raw string, fall through
+        # Braces
+        if token == "{":
+            depth += 1
+        elif token == "}":
+            depth -= 1
+            if depth == 0:
+                return m.start()
 
         # Regular string literal
-        if ch == '"':
-            i += 1
-            while i < length and source[i] != '"':
-                if source[i] == "\\":
-                    i += 2  # skip escape sequence
-                else:
-                    i += 1
+        elif token == '"':
+            while True:
+                special = STRING_SPECIAL_RE.search(source, i)
+                if special is None:
+                    i = length
+                    break
+                i = special.start()
+                if source[i] == '"':
+                    break
+                i += 2  # skip escape sequence
             i += 1  # skip closing quote
-            continue
 
         # Character literal
-        if ch == "'":
+        elif token == "'":
             # Distinguish char literals from lifetime annotations.
             # A char literal: 'x', '\\n', '\\x41', '\\u{1F600}'
             # A lifetime: 'a, 'static, '_ (followed by an identifier char)
-            # We need to check if this looks like a char literal.
-            if i + 1 < length:
-                next_ch = source[i + 1]
-                if next_ch == "\\":
+            # Otherwise it's a lifetime or label: just skip the apostrophe.
+            if i < length:
+                if source[i] == "\\":
                     # Escape sequence in char literal: '\n', '\x41', etc.
-                    i += 2  # skip ' and \
-                    # Skip the escaped char(s)
-                    while i < length and source[i] != "'":
-                        i += 1
-                    i += 1  # skip closing '
-                    continue
-                elif i + 2 < length and source[i + 2] == "'":
+                    # Skip the escaped char(s) and the closing '
+                    close = source.find("'", i + 1)
+                    i = length if close == -1 else close + 1
+                elif i + 1 < length and source[i + 1] == "'":
                     # Simple char literal: 'x'
-                    i += 3
-                    continue
-            # Otherwise it's a lifetime or label, just skip the apostrophe
-            i += 1
-            continue
+                    i += 2
 
-        # Braces
-        if ch == "{":
-            depth += 1
-        elif ch == "}":
-            depth -= 1
-            if depth == 0:
-                return i
+        # Line comment
+        elif token == "//":
+            # Skip to end of line
+            newline = source.find("\n", i)
+            if newline == -1:
+                i = length
+            else:
+                i = newline + 1
+
+        # Block comment (supports nesting)
+        elif token == "/*":
+            comment_depth = 1
+            while comment_depth > 0:
+                delim = COMMENT_DELIM_RE.search(source, i)
+                if delim is None:
+                    i = length
+                    break
+                comment_depth += 1 if delim.group() == "/*" else -1
+                i = delim.end()
 
-        i += 1
+        # Raw string literal: r#"..."#, r##"..."##, br#"..."#, etc.
+        else:
+            # Find closing: "###
+            closing = '"' + m.group("hashes")
+            end = source.find(closing, i)
+            if end == -1:
+                raise BraceMatchError(
+                    f"Unterminated raw string literal starting at position {m.start()}"
+                )
+            i = end + len(closing)
 
     raise BraceMatchError(f"No matching closing brace found (started at position {open_pos})")
 
@@ -178,6 +180,9 @@ CFG_TEST_MOD_RE = re.compile(
     re.MULTILINE,
 )
 
+# One level of indentation, or the whole of a whitespace-only line
+DEDENT_RE = re.compile(r"^(?:    |[^\S\n]+$)", re.MULTILINE)
+
 # Pattern for already-external test module declaration
 EXTERN_MOD_RE = re.compile(
     r"#\[cfg\(test\)\]\s*\n\s*mod\s+tests\s*;",
@@ -186,39 +191,56 @@ EXTERN_MOD_RE = re.compile(
 
 
 def dedent_test_content(content: str) -> str:
-    """Remove one level of indentation (4 spaces) from test content."""
-    lines = content.split("\n")
-    dedented = []
-    for line in lines:
-        if line.startswith("    "):
-            dedented.append(line[4:])
-        elif line.strip() == "":
-            dedented.append("")
-        else:
-            # Line isn't indented by 4 — keep as-is
-            dedented.append(line)
-    return "\n".join(dedented)
+    """Remove one level of indentation (4 spaces) from test content.
+
+    Whitespace-only lines are emptied; lines not indented by 4 are kept as-is.
+    """
+    return DEDENT_RE.sub("", content)
+
+
+def read_test_candidate(path: str) -> str | None:
+    """Read a source file, or return None if it has no #[cfg(test)] at all.
+
+    The file is mapped rather than read, so the many files without the
+    attribute are rejected without being copied or decoded.
+    """
+    with open(path, "rb") as f:
+        # Empty files can't be mapped
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if mm.find(b"#[cfg(test)]") == -1:
+                return None
+            source = mm[:].decode("utf-8")
+
+    # Same newline translation as reading in text mode
+    if "\r" in source:
+        source = source.replace("\r\n", "\n").replace("\r", "\n")
+    return source
 
 
-def extract_test_module(source_path: Path) -> ExtractionResult | None:
-    """Extract the inline test module from a source file.
+def find_inline_test_module(source: str) -> re.Match | None:
+    """Find the start of the inline test module in a source file.
 
     Returns None if:
     - File has no inline test module
     - File already uses external test module (mod tests;)
-    - A tests.rs sibling already exists
     """
-    source = source_path.read_text(encoding="utf-8")
-
     # Skip if already using external test module
     if EXTERN_MOD_RE.search(source):
         return None
 
     # Find inline test module
-    match = CFG_TEST_MOD_RE.search(source)
-    if match is None:
-        return None
+    return CFG_TEST_MOD_RE.search(source)
 
+
+def extract_test_module(source_path: Path, source: str, match: re.Match) -> ExtractionResult | None:
+    """Extract the inline test module found by find_inline_test_module.
+
+    Returns None if:
+    - A tests.rs sibling already exists
+    - The module's closing brace can't be found
+    """
     # Determine where the tests.rs file should go.
     # Rust module resolution rules:
     #   lib.rs / main.rs (crate roots): mod tests; → src/tests.rs (same dir)
@@ -247,10 +269,10 @@ def extract_test_module(source_path: Path) -> ExtractionResult | None:
         print(f"  WARNING: {source_path}: {e}", file=sys.stderr)
         return None
 
-    # Calculate line numbers (1-indexed)
-    block_start_line = source[:match.start()].count("\n") + 1
-    block_end_line = source[: close_brace_pos + 1].count("\n") + 1
-    total_lines = source.count("\n") + 1
+    # Calculate line numbers (1-indexed), counting each stretch of the file once
+    block_start_line = source.count("\n", 0, match.start()) + 1
+    block_end_line = block_start_line + source.count("\n", match.start(), close_brace_pos + 1)
+    total_lines = block_end_line + source.count("\n", close_brace_pos + 1)
 
     # Extract the inner content (between { and })
     inner_content = source[open_brace_pos + 1 : close_brace_pos]
@@ -308,18 +330,92 @@ def extract_test_module(source_path: Path) -> ExtractionResult | None:
     )
 
 
-def find_rust_files(root: Path) -> list[Path]:
-    """Find all .rs files under root, excluding target/ and tests.rs files."""
+def try_extract(path: str) -> tuple[ExtractionResult | None, str | None, bool]:
+    """Read and extract one file in a worker.
+
+    Returns (result, error message, no_module), where no_module records that
+    the file has no inline test module, which holds until the file changes.
+    """
+    try:
+        source = read_test_candidate(path)
+        match = None if source is None else find_inline_test_module(source)
+        if match is None:
+            return None, None, True
+        return extract_test_module(Path(path), source, match), None, False
+    except Exception as e:
+        return None, str(e), False
+
+
+def write_extraction(result: ExtractionResult) -> None:
+    """Write the new tests.rs file and rewrite its source file."""
+    with open(result.tests_path, "w", encoding="utf-8", buffering=IO_BUFFER_SIZE) as f:
+        f.write(result.tests_content)
+    with open(result.source_path, "w", encoding="utf-8", buffering=IO_BUFFER_SIZE) as f:
+        f.write(result.new_source)
+
+
+def display_path(path: Path, cwd_prefix: str) -> str:
+    """Show path relative to cwd_prefix (the cwd plus a separator) if it's inside it."""
+    text = str(path)
+    return text[len(cwd_prefix):] if text.startswith(cwd_prefix) else text
+
+
+def file_stamp(path: str) -> list[int] | None:
+    """Return [mtime_ns, size] for path, or None if it can't be stat'ed."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+def load_seen_cache() -> dict[str, list[int]]:
+    """Load the no-inline-module cache, or start empty if it's missing, corrupt or
+    was written before this script last changed.
+    """
+    try:
+        with open(SEEN_CACHE_PATH, encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    script = file_stamp(__file__)
+    if script is None or not isinstance(cache, dict) or cache.get("script") != script:
+        return {}
+    return cache.get("files", {})
+
+
+def save_seen_cache(seen: dict[str, list[int]]) -> None:
+    """Write the no-inline-module cache, stamped with this script's own file stamp."""
+    SEEN_CACHE_PATH.parent.mkdir(exist_ok=True)
+    with open(SEEN_CACHE_PATH, "w", encoding="utf-8") as f:
+        json.dump({"script": file_stamp(__file__), "files": seen}, f)
+
+
+def find_rust_files(root: Path) -> list[str]:
+    """Find all .rs files under root, excluding target/ and tests.rs files.
+
+    Like `os.walk`, symlinked directories are not descended into and
+    unreadable directories are skipped. Paths are returned as plain strings,
+    sorted component by component the way Path sorts.
+    """
     rs_files = []
-    for dirpath, dirnames, filenames in os.walk(root):
-        # Skip target directories and hidden directories
-        dirnames[:] = [
-            d for d in dirnames if d != "target" and not d.startswith(".")
-        ]
-        for f in filenames:
-            if f.endswith(".rs") and f != "tests.rs":
-                rs_files.append(Path(dirpath) / f)
-    rs_files.sort()
+    pending = [root]
+    while pending:
+        dirpath = pending.pop()
+        try:
+            entries = os.scandir(dirpath)
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir():
+                    # Skip target directories and hidden directories
+                    name = entry.name
+                    if not entry.is_symlink() and name != "target" and not name.startswith("."):
+                        pending.append(entry.path)
+                elif entry.name.endswith(".rs") and entry.name != "tests.rs":
+                    rs_files.append(entry.path)
+    rs_files.sort(key=lambda path: path.split(os.sep))
     return rs_files
 
 
@@ -349,13 +445,22 @@ def main() -> int:
         action="store_true",
         help="Show detailed output for each file",
     )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of worker processes (default: CPU count)",
+    )
     args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
 
     mode = "APPLY" if args.apply else "DRY-RUN"
     print(f"[{mode}] Extract inline test modules to sibling files\n")
 
     if args.file:
-        files = [args.file.resolve()]
+        files = [str(args.file.resolve())]
     else:
         files = find_rust_files(args.root.resolve())
 
@@ -363,11 +468,28 @@ def main() -> int:
     skipped = 0
     errors = 0
 
+    # Skip files seen unchanged since a run found no inline module in them
+    seen = load_seen_cache()
+    stamps = {path: file_stamp(path) for path in files}
+    pending = []
     for path in files:
-        try:
-            result = extract_test_module(path)
-        except Exception as e:
-            print(f"  ERROR: {path}: {e}", file=sys.stderr)
+        if stamps[path] is not None and seen.get(path) == stamps[path]:
+            skipped += 1
+        else:
+            pending.append(path)
+
+    # Files are independent; pool.map keeps the report in file order
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        outcomes = list(pool.map(try_extract, pending, chunksize=32))
+
+    cwd_prefix = os.path.join(Path.cwd(), "")
+    for path, (result, error, no_module) in zip(pending, outcomes):
+        # Stamped before reading, so an edit made meanwhile invalidates it
+        if no_module and stamps[path] is not None:
+            seen[path] = stamps[path]
+
+        if error is not None:
+            print(f"  ERROR: {path}: {error}", file=sys.stderr)
             errors += 1
             continue
 
@@ -379,8 +501,8 @@ def main() -> int:
 
         test_lines = result.block_end_line - result.block_start_line + 1
         pct = test_lines * 100 // result.total_lines
-        rel_source = result.source_path.relative_to(Path.cwd()) if Path.cwd() in result.source_path.parents or Path.cwd() == result.source_path.parent else result.source_path
-        rel_tests = result.tests_path.relative_to(Path.cwd()) if Path.cwd() in result.tests_path.parents or Path.cwd() == result.tests_path.parent else result.tests_path
+        rel_source = display_path(result.source_path, cwd_prefix)
+        rel_tests = display_path(result.tests_path, cwd_prefix)
 
         print(f"  {rel_source}")
         print(f"    → {rel_tests}")
@@ -392,6 +514,8 @@ def main() -> int:
                 print(f"      | {line}")
             print()
 
+    save_seen_cache(seen)
+
     print(f"\n{'─' * 50}")
     print(f"  Files to extract: {len(results)}")
     print(f"  Files skipped:    {skipped}")
@@ -404,18 +528,11 @@ def main() -> int:
 
     # Apply changes
     print(f"\n  Applying changes...")
-    applied = 0
-    for result in results:
-        # Create directory if needed
-        result.tests_path.parent.mkdir(parents=True, exist_ok=True)
-
-        # Write the tests.rs file
-        result.tests_path.write_text(result.tests_content, encoding="utf-8")
-
-        # Rewrite the source file
-        result.source_path.write_text(result.new_source, encoding="utf-8")
-
-        applied += 1
+    # Create each tests.rs directory once, then overlap the writes
+    for tests_dir in {result.tests_path.parent for result in results}:
+        tests_dir.mkdir(parents=True, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=WRITE_THREADS) as pool:
+        applied = len(list(pool.map(write_extraction, results)))
 
     print(f"  Applied {applied} extractions successfully.")
 
@@ -10,8 +10,11 @@ Only modifies strings that look like Ori source (contain @-declarations,
 type declarations, etc.).
 """
 
+import json
+import os
 import re
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 # Pattern for Ori item declarations with expression bodies
@@ -24,14 +27,43 @@ from pathlib import Path
 BLOCK_ENDINGS = {'}'}
 
 # Patterns that indicate continuation onto the next line
-CONTINUATION_ENDINGS = [
+CONTINUATION_ENDINGS = (
     ' yield', ' then', ' else', ' do', ' in', ' ->', ' =',
     ' +', ' -', ' *', ' /', ' %', ' &&', ' ||', ' |>', ' ==', ' !=',
     ' <', ' >', ' <=', ' >=', ' <<', ' >>', ' &', ' |', ' ^',
     ' and', ' or', ',',
-]
+)
 
-CONTINUATION_STARTS = ['.', '|>']
+CONTINUATION_STARTS = ('.', '|>')
+
+# Read/write buffer large enough to move a whole test file in one syscall
+IO_BUFFER_SIZE = 1 << 20
+
+# Files last seen needing no fixes, mapped to their [mtime_ns, size] so
+# unchanged ones are skipped on the next run. It is stamped with this script's
+# own [mtime_ns, size] and discarded once the script (and so its rules) changes.
+# Delete it to rescan everything.
+SEEN_CACHE_PATH = Path(__file__).resolve().parent.parent / '.cache' / 'fix_rust_ori_strings_seen.json'
+
+# Start of a Rust string literal: r"...", r#"..."# or "..."
+STRING_START_RE = re.compile(r'r#?"|"')
+
+# Characters that end or escape within a string literal
+STRING_SPECIAL_RE = re.compile(r'["\\]')
+
+# Strings containing function/type declarations look like Ori source
+ORI_SOURCE_RE = re.compile(r'@\w+\s*[\(<]|^type\s+\w|^\s*@\w+\s*[\(<]|pub\s+@\w+', re.MULTILINE)
+
+# Declaration head at the start of a trimmed line:
+#   @name, type Name, let $name or $name =, each optionally pub
+DECL_HEAD_RE = re.compile(r'(?:pub\s+)?(?:@\w+|type\s+\w+|let\s+\$|\$\w+\s*=)')
+
+# First characters of every declaration head above (@, pub, type, let, $)
+DECL_HEAD_CHARS = frozenset('@ptl$')
+
+# Whole single-line string that is an Ori declaration (pub is not
+# accepted before @name here; the caller also requires an '=')
+SINGLE_LINE_DECL_RE = re.compile(r'@\w+|(?:pub\s+)?(?:type\s+\w+|let\s+\$\w+|\$\w+\s*=)')
 
 
 def needs_semicolon(line: str) -> bool:
@@ -46,22 +78,19 @@ def needs_semicolon(line: str) -> bool:
     if stripped.endswith('}'):
         return False
     # Check if line ends with a continuation
-    for cont in CONTINUATION_ENDINGS:
-        if stripped.endswith(cont):
-            return False
-    return True
+    return not stripped.endswith(CONTINUATION_ENDINGS)
 
 
 def is_item_declaration_line(line: str) -> bool:
     """Check if a line starts an Ori item declaration."""
-    stripped = line.lstrip()
-    # Function/test: @name or pub @name
-    if stripped.startswith('@') or stripped.startswith('pub @'):
-        return True
-    # Type declaration: type Name =
-    if stripped.startswith('type ') or stripped.startswith('pub type '):
-        return True
-    return False
+    # Function/test: @name or pub @name; type declaration: type Name =
+    return line.lstrip().startswith(('@', 'pub @', 'type ', 'pub type '))
+
+
+def starts_declaration(line: str) -> bool:
+    """Check if a trimmed line starts with an Ori declaration head."""
+    # Body and expression lines mostly fail the first-character test
+    return line[:1] in DECL_HEAD_CHARS and DECL_HEAD_RE.match(line) is not None
 
 
 def next_line_is_continuation(lines: list, idx: int) -> bool:
@@ -70,10 +99,7 @@ def next_line_is_continuation(lines: list, idx: int) -> bool:
         next_stripped = lines[i].strip()
         if not next_stripped or next_stripped.startswith('//'):
             continue
-        for start in CONTINUATION_STARTS:
-            if next_stripped.startswith(start):
-                return True
-        return False
+        return next_stripped.startswith(CONTINUATION_STARTS)
     return False
 
 
@@ -122,8 +148,16 @@ def extract_and_fix_rust_strings(content: str) -> str:
     i = 0
 
     while i < len(content):
+        # Copy everything up to the next string literal in one piece
+        m = STRING_START_RE.search(content, i)
+        if m is None:
+            result.append(content[i:])
+            break
+        result.append(content[i:m.start()])
+        i = m.start()
+
         # Look for raw strings: r"..." or r#"..."#
-        if content[i:i+2] == 'r"' or content[i:i+3] == 'r#"':
+        if content[i] == 'r':
             # Find the raw string
             if content[i:i+3] == 'r#"':
                 start = i
@@ -166,7 +200,7 @@ def extract_and_fix_rust_strings(content: str) -> str:
                 i = end_idx + 1
 
         # Look for regular strings: "..."
-        elif content[i] == '"':
+        else:
             start = i
             i += 1
             end_idx = find_unescaped_quote(content, i)
@@ -184,9 +218,6 @@ def extract_and_fix_rust_strings(content: str) -> str:
                 result.append(content[start:end_idx + 1])
 
             i = end_idx + 1
-        else:
-            result.append(content[i])
-            i += 1
 
     return ''.join(result)
 
@@ -194,38 +225,30 @@ def extract_and_fix_rust_strings(content: str) -> str:
 def find_unescaped_quote(content: str, start: int) -> int:
     """Find the next unescaped double quote."""
     i = start
-    while i < len(content):
-        if content[i] == '\\':
-            i += 2  # Skip escaped character
-        elif content[i] == '"':
+    while True:
+        m = STRING_SPECIAL_RE.search(content, i)
+        if m is None:
+            return -1
+        i = m.start()
+        if content[i] == '"':
             return i
-        else:
-            i += 1
-    return -1
+        i += 2  # Skip escaped character
 
 
 def looks_like_ori(s: str) -> bool:
     """Check if a string looks like Ori source code."""
-    # Must contain function declarations, type declarations, or similar
-    return bool(re.search(r'@\w+\s*[\(<]|^type\s+\w|^\s*@\w+\s*[\(<]|pub\s+@\w+', s, re.MULTILINE))
+    # Must contain function declarations, type declarations, or similar.
+    # Every alternative needs an '@' or 'type', so rule those out first.
+    if '@' not in s and 'type' not in s:
+        return False
+    return bool(ORI_SOURCE_RE.search(s))
 
 
 def looks_like_ori_single_line(s: str) -> bool:
     """Check if a single-line string looks like an Ori declaration."""
     s = s.strip()
-    # Function declaration: @name (...) -> type = expr
-    if re.match(r'@\w+', s) and '=' in s:
-        return True
-    # Type declaration: type Name = ...
-    if re.match(r'(pub\s+)?type\s+\w+', s) and '=' in s:
-        return True
-    # Constant: let $name = ...
-    if re.match(r'(pub\s+)?let\s+\$\w+', s) and '=' in s:
-        return True
-    # Constant shorthand: $name = ...
-    if re.match(r'(pub\s+)?\$\w+\s*=', s):
-        return True
-    return False
+    # @name (...) -> type = expr, type Name = ..., let $name = ..., $name = ...
+    return s[:1] in DECL_HEAD_CHARS and '=' in s and SINGLE_LINE_DECL_RE.match(s) is not None
 
 
 def fix_single_line_ori(s: str) -> str:
@@ -254,8 +277,7 @@ def fix_single_line_ori(s: str) -> str:
     if '=' in stripped:
         # Find the = that's part of the declaration (not == or !=)
         # Simple check: if it has @name or type or let $
-        if re.match(r'@\w+', stripped) or re.match(r'(pub\s+)?type\s+', stripped) or \
-           re.match(r'(pub\s+)?let\s+\$', stripped) or re.match(r'(pub\s+)?\$\w+\s*=', stripped):
+        if starts_declaration(stripped):
             return stripped + ';'
 
     return s
@@ -271,12 +293,11 @@ def fix_multi_decl_string(s: str) -> str:
            not stripped.endswith('}') and '=' in stripped:
             # Check if it's a declaration
             trimmed = stripped.lstrip()
-            if re.match(r'@\w+', trimmed) or re.match(r'(pub\s+)?type\s+', trimmed) or \
-               re.match(r'(pub\s+)?let\s+\$', trimmed) or re.match(r'(pub\s+)?\$\w+\s*=', trimmed):
+            if starts_declaration(trimmed):
                 # Check if next part is a continuation
                 if j + 1 < len(parts):
                     next_part = parts[j+1].strip()
-                    if next_part and (next_part.startswith('.') or next_part.startswith('|>')):
+                    if next_part.startswith(CONTINUATION_STARTS):
                         result.append(part)
                         continue
                 result.append(stripped + ';')
@@ -313,25 +334,9 @@ def fix_ori_in_string(s: str) -> str:
 
         # Is this a single-line declaration with body?
         if '=' in trimmed:
-            is_decl = False
-            if re.match(r'@\w+', trimmed):
-                is_decl = True
-            elif re.match(r'(pub\s+)?@\w+', trimmed):
-                is_decl = True
-            elif re.match(r'(pub\s+)?type\s+\w+', trimmed):
-                is_decl = True
-            elif re.match(r'(pub\s+)?let\s+\$', trimmed):
-                is_decl = True
-            elif re.match(r'(pub\s+)?\$\w+\s*=', trimmed):
-                is_decl = True
-
-            if is_decl:
+            if starts_declaration(trimmed):
                 # Check for continuation
-                has_continuation = False
-                for cont in CONTINUATION_ENDINGS:
-                    if stripped.endswith(cont):
-                        has_continuation = True
-                        break
+                has_continuation = stripped.endswith(CONTINUATION_ENDINGS)
 
                 if not has_continuation:
                     # Check next non-empty line
@@ -339,10 +344,7 @@ def fix_ori_in_string(s: str) -> str:
                         next_line = lines[j].strip()
                         if not next_line or next_line.startswith('//'):
                             continue
-                        for start in CONTINUATION_STARTS:
-                            if next_line.startswith(start):
-                                has_continuation = True
-                                break
+                        has_continuation = next_line.startswith(CONTINUATION_STARTS)
                         break
 
                 if not has_continuation:
@@ -359,42 +361,103 @@ def fix_ori_in_string(s: str) -> str:
     return '\n'.join(result)
 
 
-def process_file(filepath: Path) -> bool:
+def process_file(filepath: str) -> bool:
     """Process a single Rust file. Returns True if modified."""
-    content = filepath.read_text()
+    with open(filepath, buffering=IO_BUFFER_SIZE) as f:
+        content = f.read()
     new_content = extract_and_fix_rust_strings(content)
 
     if new_content != content:
-        filepath.write_text(new_content)
+        with open(filepath, "w", buffering=IO_BUFFER_SIZE) as f:
+            f.write(new_content)
         return True
     return False
 
 
+def file_stamp(path: str) -> list:
+    """Return [mtime_ns, size] for path."""
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+def load_seen_cache() -> dict:
+    """Load the no-fix-needed cache, or start empty if it's missing, corrupt or
+    was written before this script last changed.
+    """
+    try:
+        with open(SEEN_CACHE_PATH) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    script = file_stamp(__file__)
+    if not isinstance(cache, dict) or cache.get('script') != script:
+        return {}
+    return cache.get('files', {})
+
+
+def save_seen_cache(seen: dict):
+    """Write the no-fix-needed cache, stamped with this script's own file stamp."""
+    SEEN_CACHE_PATH.parent.mkdir(exist_ok=True)
+    with open(SEEN_CACHE_PATH, 'w') as f:
+        json.dump({'script': file_stamp(__file__), 'files': seen}, f)
+
+
+def find_test_files(compiler_dir: Path) -> list:
+    """Find Rust test files under compiler_dir in a single walk.
+
+    A test file has 'test' in its name, sits directly in a directory named
+    test, or lies anywhere inside a directory named tests (integration
+    tests). Symlinked directories are not descended into and unreadable
+    directories are skipped. Paths are returned as plain strings, sorted
+    component by component the way Path sorts.
+    """
+    test_files = []
+    pending = [(str(compiler_dir), False)]
+    while pending:
+        dirpath, in_tests = pending.pop()
+        parent_is_test = os.path.basename(dirpath) == 'test'
+        try:
+            entries = os.scandir(dirpath)
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                name = entry.name
+                if entry.is_dir():
+                    if not entry.is_symlink():
+                        pending.append((entry.path, in_tests or name == 'tests'))
+                elif name.endswith('.rs') and (in_tests or parent_is_test or 'test' in name):
+                    test_files.append(entry.path)
+    test_files.sort(key=lambda path: path.split(os.sep))
+    return test_files
+
+
 def main():
     """Process all Rust test files in the compiler directory."""
     compiler_dir = Path(__file__).parent.parent / 'compiler'
 
-    # Find all Rust test files
-    test_files = []
-    for rs_file in compiler_dir.rglob('*.rs'):
-        # Only process test files
-        name = rs_file.name
-        path_str = str(rs_file)
-        if 'test' in name or 'test' in path_str.split('/')[-2:]:
-            test_files.append(rs_file)
-
-    # Also check for integration test directories
-    for test_dir in compiler_dir.rglob('tests'):
-        if test_dir.is_dir():
-            for rs_file in test_dir.rglob('*.rs'):
-                if rs_file not in test_files:
-                    test_files.append(rs_file)
+    test_files = find_test_files(compiler_dir)
+
+    # Skip files seen unchanged since a run found nothing to fix in them.
+    # Stamps are taken before reading, so an edit made meanwhile invalidates it.
+    seen = load_seen_cache()
+    stamps = [file_stamp(f) for f in test_files]
+    pending = [(f, stamp) for f, stamp in zip(test_files, stamps) if seen.get(f) != stamp]
 
+    # Files are independent, so fix them across worker processes
+    with ProcessPoolExecutor() as pool:
+        changed = list(pool.map(process_file, [f for f, _ in pending], chunksize=32))
+
+    # Report paths relative to the repo root, i.e. starting at compiler/
+    root_len = len(str(compiler_dir))
     modified = 0
-    for filepath in sorted(test_files):
-        if process_file(filepath):
-            print(f"  Fixed: {filepath.relative_to(compiler_dir.parent)}")
+    for (filepath, stamp), was_modified in zip(pending, changed):
+        if was_modified:
+            print(f"  Fixed: {compiler_dir.name}{filepath[root_len:]}")
             modified += 1
+        else:
+            seen[filepath] = stamp
+    save_seen_cache(seen)
 
     print(f"\nProcessed {len(test_files)} files, modified {modified}")
 
@@ -16,59 +16,94 @@ Usage:
 """
 
 import os
+import re
+import shutil
 import sys
+from concurrent.futures import ProcessPoolExecutor
 
+# Read/write buffer large enough to move a whole test file in one syscall
+IO_BUFFER_SIZE = 1 << 20
 
-def fix_file(filepath):
-    """Remove `;` from then-branches that are followed by `else` on the next line."""
-    with open(filepath, "r") as f:
-        lines = f.readlines()
+# The `;` (and trailing whitespace) ending a line whose next non-blank
+# line starts with `else`. `[^\S\n]` is whitespace within a line.
+THEN_SEMICOLON_RE = re.compile(r";[^\S\n]*(?=\n(?:[^\S\n]*\n)*[^\S\n]*else)")
 
-    changes = 0
-    result = []
-    n = len(lines)
 
-    for i in range(n):
-        line = lines[i]
-        stripped = line.rstrip()
+def write_atomically(filepath, content):
+    """Replace filepath with content, so an interrupted write never truncates it."""
+    tmp_path = f"{filepath}.tmp"
+    with open(tmp_path, "w", buffering=IO_BUFFER_SIZE) as f:
+        f.write(content)
+    shutil.copymode(filepath, tmp_path)
+    os.replace(tmp_path, filepath)
 
-        # Check if this line ends with `;` and the next non-blank line starts with `else`
-        if stripped.endswith(";"):
-            # Look ahead for `else` on next non-blank line
-            j = i + 1
-            while j < n and lines[j].strip() == "":
-                j += 1
 
-            if j < n and lines[j].lstrip().startswith("else"):
-                # Remove the trailing `;` from this line
-                result.append(stripped[:-1] + "\n")
-                changes += 1
-                continue
+def fix_file(filepath):
+    """Remove `;` from then-branches that are followed by `else` on the next line."""
+    with open(filepath, "r", buffering=IO_BUFFER_SIZE) as f:
+        content = f.read()
 
-        result.append(line)
+    content, changes = THEN_SEMICOLON_RE.subn("", content)
 
     if changes > 0:
-        with open(filepath, "w") as f:
-            f.writelines(result)
-        print(f"  {filepath}: {changes} semicolons removed")
+        write_atomically(filepath, content)
 
     return changes
 
 
+def iter_files(root, suffixes):
+    """Yield paths of files under root whose names end with one of suffixes.
+
+    Like `os.walk`, symlinked directories are not descended into and
+    unreadable directories are skipped.
+    """
+    pending = [root]
+    while pending:
+        dirpath = pending.pop()
+        try:
+            entries = os.scandir(dirpath)
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir():
+                    if not entry.is_symlink():
+                        pending.append(entry.path)
+                elif entry.name.endswith(suffixes):
+                    yield entry.path
+
+
+def collect_files(paths):
+    """Collect .ori and .ori.expected files from paths (recursive for dirs).
+
+    Files under each directory are sorted by directory, then by name.
+    """
+    suffixes = (".ori", ".ori.expected")
+    files = []
+    for path in paths:
+        if os.path.isfile(path) and path.endswith(suffixes):
+            files.append(path)
+        elif os.path.isdir(path):
+            files.extend(sorted(iter_files(path, suffixes), key=os.path.split))
+    return files
+
+
 def main():
     if len(sys.argv) < 2:
         print("Usage: python3 scripts/fix_then_semicolons.py <path>...")
         sys.exit(1)
 
+    files = collect_files(sys.argv[1:])
+
+    # Files are independent, so fix them across worker processes
+    with ProcessPoolExecutor() as pool:
+        counts = list(pool.map(fix_file, files, chunksize=32))
+
     total = 0
-    for path in sys.argv[1:]:
-        if os.path.isfile(path) and (path.endswith(".ori") or path.endswith(".ori.expected")):
-            total += fix_file(path)
-        elif os.path.isdir(path):
-            for root, _, files in sorted(os.walk(path)):
-                for fname in sorted(files):
-                    if fname.endswith(".ori") or fname.endswith(".ori.expected"):
-                        total += fix_file(os.path.join(root, fname))
+    for filepath, changes in zip(files, counts):
+        if changes > 0:
+            print(f"  {filepath}: {changes} semicolons removed")
+        total += changes
 
     print(f"\nTotal: {total} semicolons removed")
 
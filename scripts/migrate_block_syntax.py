@@ -22,10 +22,43 @@ Usage:
 """
 
 import argparse
+import difflib
+import functools
+import os
 import re
+import shutil
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+# Every old-syntax construct contains one of these (`do run(` contains `run(`)
+OLD_SYNTAX_KEYWORDS = ('run(', 'match(', 'try(', 'loop(', 'unsafe(')
+
+# Start of an old-syntax construct; the group that matched names it.
+# `[^\W_]` is an alphanumeric character, so the lookbehinds skip 'return(',
+# 'rerun(', '.run(' (method call) and '.match(' / 'my_match(' (guards).
+KEYWORD_RE = re.compile(
+    r'(do) \s*run\('
+    r'|(?<![^\W_])(loop|unsafe|try)\('
+    r'|(?<![^\W_])(?<!\.)(run)\('
+    r'|(?<![._])(match)\('
+)
+
+# Brackets and string quotes: the only characters that change nesting
+NESTING_TOKEN_RE = re.compile(r'[()\[\]{}"`]')
+
+# Nesting characters plus the comma that separates arguments
+ARG_TOKEN_RE = re.compile(r'[()\[\]{}"`,]')
+
+# Characters that affect which commas in a block are statement separators
+BLOCK_TOKEN_RE = re.compile(r'["`\'()\[\]{}<>,]|//')
+
+# Rest of a string literal after its opening quote, through the closing quote
+STRING_REST_RE = {
+    quote: re.compile(rf'[^{quote}\\]*(?:\\.[^{quote}\\]*)*{quote}', re.DOTALL)
+    for quote in '"`'
+}
+
 
 class BlockSyntaxMigrator:
     """Migrates Ori code from run()/match()/try() to block syntax."""
@@ -46,8 +79,8 @@ class BlockSyntaxMigrator:
             "contract_flags": [],
         }
 
-    def migrate_file(self, path: Path) -> str | None:
-        """Migrate a file. Returns new content if changed, None if unchanged."""
+    def migrate_file(self, path: Path) -> tuple[str, str] | None:
+        """Migrate a file. Returns (old, new) content if changed, None if unchanged."""
         content = path.read_text()
 
         if path.suffix == ".md":
@@ -59,9 +92,14 @@ class BlockSyntaxMigrator:
 
         if new_content != content:
             self.stats["files_modified"] += 1
-            return new_content
+            return content, new_content
         return None
 
+    def merge_stats(self, stats: dict):
+        """Add another migrator's stats into this one's."""
+        for key, value in stats.items():
+            self.stats[key] += value
+
     def _migrate_markdown(self, content: str, path: Path) -> str:
         """Migrate code blocks inside markdown files."""
         # Find ```ori ... ``` blocks and transform their contents
@@ -82,73 +120,68 @@ class BlockSyntaxMigrator:
 
     def _migrate_ori(self, code: str, path: Path) -> str:
         """Apply all transformations to Ori code."""
-        # Order matters: compound forms first, then simple forms
-
-        # 1. loop(run(...)) → loop { ... }
-        code = self._convert_loop_run(code, path)
-
-        # 2. unsafe(run(...)) → unsafe { ... }
-        code = self._convert_unsafe_run(code, path)
+        # Most snippets use none of the old forms; keep them out of the cache
+        if any(keyword in code for keyword in OLD_SYNTAX_KEYWORDS):
+            code, stats = convert_blocks(code)
+            self.merge_stats(stats)
 
-        # 3. for ... do run(...) → for ... do { ... }
-        code = self._convert_for_do_run(code, path)
-
-        # 4. loop(single_expr) → loop { single_expr }
-        # (Must come AFTER loop(run(...)) to avoid double-conversion)
-        code = self._convert_loop_single(code, path)
-
-        # 5. match(expr, arms...) → match expr { arms... }
-        code = self._convert_match(code, path)
-
-        # 6. try(...) → try { ... }
-        code = self._convert_try(code, path)
-
-        # 7. run(...) → { ... }
-        # (Must come LAST — other forms contain run() that we handle specially)
-        code = self._convert_run(code, path)
-
-        # 8. Flag contracts for manual review
+        # Flag contracts for manual review
         self._flag_contracts(code, path)
 
         return code
 
-    def _find_balanced_close(self, text: str, start: int) -> int | None:
+    def _convert_blocks(self, code: str) -> str:
+        """Convert every old-syntax construct in one left-to-right scan.
+
+        Each converted construct recurses into its own contents, so nested
+        forms are handled in the same walk; text between constructs is
+        copied through unchanged.
+        """
+        result = []
+        last = 0
+        for m in KEYWORD_RE.finditer(code):
+            if m.start() < last:
+                # Inside a construct that was already converted
+                continue
+            converted = self._CONVERTERS[m[m.lastindex]](self, code, m.end() - 1)
+            if converted is None:
+                continue
+            replacement, end = converted
+            result.append(code[last:m.start()])
+            result.append(replacement)
+            last = end
+        result.append(code[last:])
+        return ''.join(result)
+
+    @staticmethod
+    def _find_balanced_close(text: str, start: int) -> int | None:
         """Find the matching close paren for an open paren at `start`.
 
         Returns the index of the closing paren, or None if not found.
         Handles nested parens, brackets, braces, and string literals.
         """
         depth = 0
-        i = start
-        in_string = None  # None, '"', or '`'
+        pos = start
 
-        while i < len(text):
-            ch = text[i]
+        while m := NESTING_TOKEN_RE.search(text, pos):
+            ch = m.group()
+            pos = m.end()
 
             # Handle string literals
-            if in_string:
-                if ch == '\\' and i + 1 < len(text):
-                    i += 2  # skip escape
-                    continue
-                if ch == in_string:
-                    in_string = None
-                i += 1
-                continue
-
             if ch in ('"', '`'):
-                in_string = ch
-                i += 1
+                string = STRING_REST_RE[ch].match(text, pos)
+                if string is None:
+                    return None
+                pos = string.end()
                 continue
 
             # Handle nesting
             if ch in ('(', '[', '{'):
                 depth += 1
-            elif ch in (')', ']', '}'):
+            else:
                 depth -= 1
                 if depth == 0:
-                    return i
-
-            i += 1
+                    return m.start()
 
         return None
 
@@ -176,71 +209,53 @@ class BlockSyntaxMigrator:
         All depth-0 commas become semicolons, then the last semicolon is removed
         (making the final expression the block result).
         """
-        # Character-by-character scan: convert all depth-0 commas to semicolons
+        # Hop between the characters that matter: convert all depth-0 commas
+        # to semicolons, copying the text in between as whole slices
         result = []
         depth = 0       # depth for (), [], {}
         angle_depth = 0  # separate depth for <> (generic type arguments)
-        in_string = None
-        semicolon_positions = []  # track positions of converted semicolons
-        i = 0
-        while i < len(block_content):
-            ch = block_content[i]
-            if in_string:
-                if ch == '\\' and i + 1 < len(block_content):
-                    result.append(ch)
-                    result.append(block_content[i + 1])
-                    i += 2
-                    continue
-                if ch == in_string:
-                    in_string = None
-                result.append(ch)
-            elif ch in ('"', '`'):
-                in_string = ch
-                result.append(ch)
-            elif ch == "'":
+        last = 0
+        pos = 0
+        while m := BLOCK_TOKEN_RE.search(block_content, pos):
+            token = m.group()
+            i = m.start()
+            pos = m.end()
+            if token in ('"', '`'):
+                string = STRING_REST_RE[token].match(block_content, pos)
+                if string is None:
+                    break
+                pos = string.end()
+            elif token == "'":
                 # Char literal: 'x' or '\n' — copy verbatim
-                result.append(ch)
-                i += 1
-                if i < len(block_content) and block_content[i] == '\\':
-                    result.append(block_content[i])
-                    i += 1
-                if i < len(block_content):
-                    result.append(block_content[i])
-                    i += 1
-                if i < len(block_content) and block_content[i] == "'":
-                    result.append(block_content[i])
-                    i += 1
-                continue
-            elif ch == '/' and i + 1 < len(block_content) and block_content[i + 1] == '/':
+                if block_content.startswith('\\', pos):
+                    pos += 1
+                if pos < len(block_content):
+                    pos += 1
+                if block_content.startswith("'", pos):
+                    pos += 1
+            elif token == '//':
                 # Line comment — copy rest of line
-                end = block_content.find('\n', i)
+                end = block_content.find('\n', pos)
                 if end == -1:
-                    result.append(block_content[i:])
-                    i = len(block_content)
-                    continue
-                result.append(block_content[i:end])
-                i = end
-                continue
-            elif ch in ('(', '[', '{'):
+                    break
+                pos = end
+            elif token in ('(', '[', '{'):
                 depth += 1
-                result.append(ch)
-            elif ch in (')', ']', '}'):
+            elif token in (')', ']', '}'):
                 depth -= 1
-                result.append(ch)
-            elif ch == '<' and i > 0 and (block_content[i-1].isalnum() or block_content[i-1] in ('_', '>')):
+            elif token == '<':
                 # Generic type bracket: Type<int, str>, not comparison x < 5
-                angle_depth += 1
-                result.append(ch)
-            elif ch == '>' and angle_depth > 0:
-                angle_depth -= 1
-                result.append(ch)
-            elif ch == ',' and depth == 0 and angle_depth == 0:
-                semicolon_positions.append(len(result))
+                if i > 0 and (block_content[i-1].isalnum() or block_content[i-1] in ('_', '>')):
+                    angle_depth += 1
+            elif token == '>':
+                if angle_depth > 0:
+                    angle_depth -= 1
+            elif depth == 0 and angle_depth == 0:
+                result.append(block_content[last:i])
                 result.append(';')
+                last = pos
                 self.stats["commas_to_semicolons"] += 1
-            else:
-                result.append(ch)
-            i += 1
+        result.append(block_content[last:])
 
         output = ''.join(result)
 
@@ -315,266 +330,137 @@ class BlockSyntaxMigrator:
         Match arms remain comma-separated per the match-arm-comma-separator-proposal.
         We only need to remove the trailing comma after the last arm (if any).
         """
-        lines = arms_content.split('\n')
-
-        # Find the last non-empty line and remove its trailing comma
-        for i in range(len(lines) - 1, -1, -1):
-            stripped = lines[i].rstrip()
-            if stripped:
-                if stripped.endswith(','):
-                    opens = stripped.count('(') + stripped.count('[') + stripped.count('{')
-                    closes = stripped.count(')') + stripped.count(']') + stripped.count('}')
-                    if opens <= closes:
-                        lines[i] = stripped[:-1] + lines[i][len(lines[i].rstrip()):]
-                break
-
-        return '\n'.join(lines)
-
-    def _convert_run(self, code: str, path: Path) -> str:
+        # The last non-whitespace character ends the last non-empty line
+        end = len(arms_content.rstrip())
+        if end and arms_content[end - 1] == ',':
+            last_line = arms_content[arms_content.rfind('\n', 0, end) + 1:end]
+            opens = last_line.count('(') + last_line.count('[') + last_line.count('{')
+            closes = last_line.count(')') + last_line.count(']') + last_line.count('}')
+            if opens <= closes:
+                return arms_content[:end - 1] + arms_content[end:]
+
+        return arms_content
+
+    def _convert_block_body(self, inner: str) -> str:
+        """Convert nested constructs in a block body, then its commas."""
+        return self._convert_commas_to_semicolons_in_block(self._convert_blocks(inner))
+
+    def _convert_run(self, code: str, open_pos: int) -> tuple[str, int] | None:
         """Convert run(...) → { ... }"""
-        result = []
-        i = 0
-
-        while i < len(code):
-            # Look for 'run(' not preceded by alphanumeric (avoid 'return(', 'rerun(', etc.)
-            if code[i:i+4] == 'run(' and (i == 0 or not code[i-1].isalnum()):
-                # Check it's not .run( (method call)
-                if i > 0 and code[i-1] == '.':
-                    result.append(code[i])
-                    i += 1
-                    continue
-
-                extracted = self._extract_balanced(code, i + 3)
-                if extracted:
-                    inner, close_pos = extracted
-                    # Recursively process nested constructs
-                    inner = self._migrate_ori(inner, path)
-                    inner = self._convert_commas_to_semicolons_in_block(inner)
-                    result.append('{')
-                    result.append(inner)
-                    result.append('}')
-                    i = close_pos + 1
-                    self.stats["run_converted"] += 1
-                    continue
-
-            result.append(code[i])
-            i += 1
-
-        return ''.join(result)
+        extracted = self._extract_balanced(code, open_pos)
+        if not extracted:
+            return None
+        inner, close_pos = extracted
+        self.stats["run_converted"] += 1
+        return '{' + self._convert_block_body(inner) + '}', close_pos + 1
 
-    def _convert_match(self, code: str, path: Path) -> str:
+    def _convert_match(self, code: str, open_pos: int) -> tuple[str, int] | None:
         """Convert match(expr, arm1, arm2) → match expr { arm1 \\n arm2 }"""
-        result = []
-        i = 0
-
-        while i < len(code):
-            # Look for 'match(' not preceded by . (not .match() guard)
-            if code[i:i+6] == 'match(' and (i == 0 or code[i-1] not in ('.', '_')):
-                # Check it's not already converted (match expr {)
-                extracted = self._extract_balanced(code, i + 5)
-                if extracted:
-                    inner, close_pos = extracted
-                    # Split on first comma to separate scrutinee from arms
-                    # But must respect nesting
-                    scrutinee, rest = self._split_first_arg(inner)
-                    if scrutinee is not None and rest is not None:
-                        # Recursively process nested constructs in arms
-                        rest = self._migrate_ori(rest, path)
-                        # Match arms stay comma-separated (per match-arm-comma-separator-proposal)
-                        rest = self._remove_trailing_commas_from_match(rest)
-                        result.append('match ')
-                        result.append(scrutinee.strip())
-                        result.append(' {')
-                        result.append(rest)
-                        result.append('}')
-                        i = close_pos + 1
-                        self.stats["match_converted"] += 1
-                        continue
-
-            result.append(code[i])
-            i += 1
-
-        return ''.join(result)
-
-    def _convert_try(self, code: str, path: Path) -> str:
+        extracted = self._extract_balanced(code, open_pos)
+        if not extracted:
+            return None
+        inner, close_pos = extracted
+        # Split on first comma to separate scrutinee from arms
+        # But must respect nesting
+        scrutinee, rest = self._split_first_arg(inner)
+        if scrutinee is None or rest is None:
+            return None
+        # Recursively process nested constructs in scrutinee and arms
+        scrutinee = self._convert_blocks(scrutinee)
+        rest = self._convert_blocks(rest)
+        # Match arms stay comma-separated (per match-arm-comma-separator-proposal)
+        rest = self._remove_trailing_commas_from_match(rest)
+        self.stats["match_converted"] += 1
+        return 'match ' + scrutinee.strip() + ' {' + rest + '}', close_pos + 1
+
+    def _convert_try(self, code: str, open_pos: int) -> tuple[str, int] | None:
         """Convert try(...) → try { ... }"""
-        result = []
-        i = 0
-
-        while i < len(code):
-            if code[i:i+4] == 'try(' and (i == 0 or not code[i-1].isalnum()):
-                extracted = self._extract_balanced(code, i + 3)
-                if extracted:
-                    inner, close_pos = extracted
-                    # Recursively process nested constructs
-                    inner = self._migrate_ori(inner, path)
-                    inner = self._convert_commas_to_semicolons_in_block(inner)
-                    result.append('try {')
-                    result.append(inner)
-                    result.append('}')
-                    i = close_pos + 1
-                    self.stats["try_converted"] += 1
-                    continue
-
-            result.append(code[i])
-            i += 1
-
-        return ''.join(result)
-
-    def _convert_loop_run(self, code: str, path: Path) -> str:
-        """Convert loop(run(...)) → loop { ... }"""
-        result = []
-        i = 0
-
-        while i < len(code):
-            # Match loop(run( or loop( run( with optional whitespace/newline
-            if code[i:i+5] == 'loop(' and (i == 0 or not code[i-1].isalnum()):
-                # Find what's inside loop(...)
-                extracted = self._extract_balanced(code, i + 4)
-                if extracted:
-                    inner, close_pos = extracted
-                    inner_stripped = inner.strip()
-                    # Check if inner content is run(...)
-                    if inner_stripped.startswith('run(') and inner_stripped.endswith(')'):
-                        # Extract the run() contents
-                        run_inner = self._extract_balanced(inner_stripped, 3)
-                        if run_inner:
-                            run_content, _ = run_inner
-                            # Recursively process nested constructs
-                            run_content = self._migrate_ori(run_content, path)
-                            run_content = self._convert_commas_to_semicolons_in_block(run_content)
-                            result.append('loop {')
-                            result.append(run_content)
-                            result.append('}')
-                            i = close_pos + 1
-                            self.stats["loop_run_converted"] += 1
-                            continue
-
-            result.append(code[i])
-            i += 1
-
-        return ''.join(result)
-
-    def _convert_loop_single(self, code: str, path: Path) -> str:
-        """Convert loop(expr) → loop { expr } for single expressions."""
-        result = []
-        i = 0
-
-        while i < len(code):
-            if code[i:i+5] == 'loop(' and (i == 0 or not code[i-1].isalnum()):
-                extracted = self._extract_balanced(code, i + 4)
-                if extracted:
-                    inner, close_pos = extracted
-                    # Recursively process nested constructs
-                    inner = self._migrate_ori(inner, path)
-                    inner = self._convert_commas_to_semicolons_in_block(inner)
-                    result.append('loop {')
-                    result.append(inner)
-                    result.append('}')
-                    i = close_pos + 1
-                    self.stats["loop_single_converted"] += 1
-                    continue
-
-            result.append(code[i])
-            i += 1
-
-        return ''.join(result)
+        extracted = self._extract_balanced(code, open_pos)
+        if not extracted:
+            return None
+        inner, close_pos = extracted
+        self.stats["try_converted"] += 1
+        return 'try {' + self._convert_block_body(inner) + '}', close_pos + 1
+
+    def _extract_run_arg(self, inner: str) -> str | None:
+        """Return the contents of run(...) if `inner` is exactly a run() call."""
+        inner_stripped = inner.strip()
+        if inner_stripped.startswith('run(') and inner_stripped.endswith(')'):
+            run_inner = self._extract_balanced(inner_stripped, 3)
+            if run_inner:
+                return run_inner[0]
+        return None
 
-    def _convert_unsafe_run(self, code: str, path: Path) -> str:
+    def _convert_loop(self, code: str, open_pos: int) -> tuple[str, int] | None:
+        """Convert loop(run(...)) → loop { ... } and loop(expr) → loop { expr }"""
+        extracted = self._extract_balanced(code, open_pos)
+        if not extracted:
+            return None
+        inner, close_pos = extracted
+        run_content = self._extract_run_arg(inner)
+        if run_content is not None:
+            self.stats["loop_run_converted"] += 1
+            return 'loop {' + self._convert_block_body(run_content) + '}', close_pos + 1
+        self.stats["loop_single_converted"] += 1
+        return 'loop {' + self._convert_block_body(inner) + '}', close_pos + 1
+
+    def _convert_unsafe_run(self, code: str, open_pos: int) -> tuple[str, int] | None:
         """Convert unsafe(run(...)) → unsafe { ... }"""
-        result = []
-        i = 0
-
-        while i < len(code):
-            if code[i:i+7] == 'unsafe(' and (i == 0 or not code[i-1].isalnum()):
-                extracted = self._extract_balanced(code, i + 6)
-                if extracted:
-                    inner, close_pos = extracted
-                    inner_stripped = inner.strip()
-                    if inner_stripped.startswith('run(') and inner_stripped.endswith(')'):
-                        run_inner = self._extract_balanced(inner_stripped, 3)
-                        if run_inner:
-                            run_content, _ = run_inner
-                            # Recursively process nested constructs
-                            run_content = self._migrate_ori(run_content, path)
-                            run_content = self._convert_commas_to_semicolons_in_block(run_content)
-                            result.append('unsafe {')
-                            result.append(run_content)
-                            result.append('}')
-                            i = close_pos + 1
-                            self.stats["unsafe_run_converted"] += 1
-                            continue
-
-            result.append(code[i])
-            i += 1
-
-        return ''.join(result)
+        extracted = self._extract_balanced(code, open_pos)
+        if not extracted:
+            return None
+        inner, close_pos = extracted
+        run_content = self._extract_run_arg(inner)
+        if run_content is None:
+            return None
+        self.stats["unsafe_run_converted"] += 1
+        return 'unsafe {' + self._convert_block_body(run_content) + '}', close_pos + 1
 
-    def _convert_for_do_run(self, code: str, path: Path) -> str:
+    def _convert_for_do_run(self, code: str, open_pos: int) -> tuple[str, int] | None:
         """Convert for ... do run(...) → for ... do { ... }"""
-        # Match 'do run(' and convert to 'do {'
-        result = []
-        i = 0
-
-        while i < len(code):
-            # Look for 'do run(' pattern
-            if code[i:i+7] == 'do run(' or (code[i:i+3] == 'do ' and i + 3 < len(code)
-                                              and code[i+3:].lstrip().startswith('run(')):
-                # Find the 'run(' part
-                run_start = code.index('run(', i)
-                extracted = self._extract_balanced(code, run_start + 3)
-                if extracted:
-                    inner, close_pos = extracted
-                    # Recursively process nested constructs
-                    inner = self._migrate_ori(inner, path)
-                    inner = self._convert_commas_to_semicolons_in_block(inner)
-                    result.append('do {')
-                    result.append(inner)
-                    result.append('}')
-                    i = close_pos + 1
-                    self.stats["for_do_run_converted"] += 1
-                    continue
-
-            result.append(code[i])
-            i += 1
-
-        return ''.join(result)
+        extracted = self._extract_balanced(code, open_pos)
+        if not extracted:
+            return None
+        inner, close_pos = extracted
+        self.stats["for_do_run_converted"] += 1
+        return 'do {' + self._convert_block_body(inner) + '}', close_pos + 1
+
+    # Converter for each keyword found by KEYWORD_RE
+    _CONVERTERS = {
+        'run': _convert_run,
+        'match': _convert_match,
+        'try': _convert_try,
+        'loop': _convert_loop,
+        'unsafe': _convert_unsafe_run,
+        'do': _convert_for_do_run,
+    }
 
-    def _split_first_arg(self, text: str) -> tuple[str | None, str | None]:
+    @staticmethod
+    def _split_first_arg(text: str) -> tuple[str | None, str | None]:
         """Split text at the first top-level comma, respecting nesting.
 
         Returns (first_arg, rest) or (None, None) if no comma found.
         """
         depth = 0
-        in_string = None
-        i = 0
-
-        while i < len(text):
-            ch = text[i]
+        pos = 0
 
-            if in_string:
-                if ch == '\\' and i + 1 < len(text):
-                    i += 2
-                    continue
-                if ch == in_string:
-                    in_string = None
-                i += 1
-                continue
+        while m := ARG_TOKEN_RE.search(text, pos):
+            ch = m.group()
+            pos = m.end()
 
             if ch in ('"', '`'):
-                in_string = ch
-                i += 1
+                string = STRING_REST_RE[ch].match(text, pos)
+                if string is None:
+                    break
+                pos = string.end()
                 continue
 
             if ch in ('(', '[', '{'):
                 depth += 1
             elif ch in (')', ']', '}'):
                 depth -= 1
-
-            if ch == ',' and depth == 0:
-                return (text[:i], text[i+1:])
-
-            i += 1
+            elif depth == 0:
+                return (text[:m.start()], text[pos:])
 
         return (None, None)
 
@@ -587,16 +473,72 @@ class BlockSyntaxMigrator:
                 )
 
 
-def collect_files(paths: list[Path], extensions: set[str]) -> list[Path]:
-    """Collect all files with given extensions from paths (recursive for dirs)."""
-    files = []
+@functools.lru_cache(maxsize=4096)
+def convert_blocks(code: str) -> tuple[str, dict]:
+    """Convert a snippet with a fresh migrator, returning the result and its stats.
+
+    Conversion depends only on the text, so snippets repeated across files
+    (common in the docs) are converted once. Callers must not mutate the
+    returned stats.
+    """
+    migrator = BlockSyntaxMigrator()
+    return migrator._convert_blocks(code), migrator.stats
+
+
+def migrate_path(path: Path) -> tuple[Path, tuple[str, str] | None, dict]:
+    """Migrate one file with a fresh migrator, returning its result and stats."""
+    migrator = BlockSyntaxMigrator()
+    return path, migrator.migrate_file(path), migrator.stats
+
+
+def write_atomically(path: Path, content: str):
+    """Replace path with content, so an interrupted write never truncates it."""
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text(content)
+    shutil.copymode(path, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def iter_files(root: str, suffixes: tuple[str, ...]):
+    """Yield paths of files under root whose names end with one of suffixes.
+
+    Like `os.walk`, symlinked directories are not descended into and
+    unreadable directories are skipped.
+    """
+    pending = [root]
+    while pending:
+        dirpath = pending.pop()
+        try:
+            entries = os.scandir(dirpath)
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir():
+                    if not entry.is_symlink():
+                        pending.append(entry.path)
+                elif entry.name.endswith(suffixes):
+                    yield entry.path
+
+
+def iter_paths(paths: list[Path], extensions: set[str]):
+    """Yield each file with given extensions from paths (recursive for dirs).
+
+    Files are yielded once each, in the order they are found.
+    """
+    suffixes = tuple(extensions)
+    seen = set()
     for p in paths:
         if p.is_file() and p.suffix in extensions:
-            files.append(p)
+            found = (p,)
         elif p.is_dir():
-            for ext in extensions:
-                files.extend(sorted(p.rglob(f"*{ext}")))
-    return sorted(set(files))
+            found = map(Path, iter_files(str(p), suffixes))
+        else:
+            continue
+        for f in found:
+            if f not in seen:
+                seen.add(f)
+                yield f
 
 
 def main():
@@ -608,7 +550,13 @@ def main():
     parser.add_argument("--verbose", "-v", action="store_true", help="Show detailed changes")
     parser.add_argument("--md-only", action="store_true", help="Only process .md files")
     parser.add_argument("--ori-only", action="store_true", help="Only process .ori files")
+    parser.add_argument(
+        "--jobs", "-j", type=int, default=os.cpu_count(),
+        help="Number of worker processes (default: CPU count)",
+    )
     args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
 
     extensions = set()
     if args.md_only:
@@ -618,30 +566,35 @@ def main():
     else:
         extensions = {".md", ".ori"}
 
-    files = collect_files(args.paths, extensions)
-    if not files:
+    # Files are independent, so migrate them across worker processes while
+    # the walk is still finding more; results are reported in path order
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        files = iter_paths(args.paths, extensions)
+        results = sorted(pool.map(migrate_path, files, chunksize=32), key=lambda r: r[0])
+    if not results:
         print("No matching files found.")
         return
 
     migrator = BlockSyntaxMigrator(verbose=args.verbose)
 
-    for f in files:
+    for f, migrated, stats in results:
         migrator.stats["files_processed"] += 1
-        new_content = migrator.migrate_file(f)
+        migrator.merge_stats(stats)
 
-        if new_content is not None:
+        if migrated is not None:
+            old_content, new_content = migrated
             if args.dry_run:
                 print(f"  WOULD MODIFY: {f}")
                 if args.verbose:
-                    # Show a compact diff
-                    old_lines = f.read_text().splitlines()
-                    new_lines = new_content.splitlines()
-                    for i, (old, new) in enumerate(zip(old_lines, new_lines)):
-                        if old != new:
-                            print(f"    L{i+1}: {old.strip()}")
-                            print(f"      → {new.strip()}")
+                    # Show a compact diff: changed hunks with one line of context
+                    diff = difflib.unified_diff(
+                        old_content.splitlines(), new_content.splitlines(),
+                        fromfile=str(f), tofile=f"{f} (new)", lineterm="", n=1,
+                    )
+                    for line in diff:
+                        print(f"    {line}")
             else:
-                f.write_text(new_content)
+                write_atomically(f, new_content)
                 print(f"  MODIFIED: {f}")
 
     # Print summary
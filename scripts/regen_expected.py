@@ -17,65 +17,70 @@ Usage:
 """
 
 import os
+import shutil
 import sys
 import re
+from concurrent.futures import ProcessPoolExecutor
 
+# Read/write buffer large enough to move a whole test file in one syscall
+IO_BUFFER_SIZE = 1 << 20
 
-def needs_semicolon_at_end(lines, idx):
-    """Check if line at idx is the end of an expression body needing `;`.
+# A line that starts an expression body: `) -> Type = expr` or `) = expr`,
+# with the body on the same line or the next, or `type X = expr`
+BODY_START_RE = re.compile(r'\)\s*(?:->\s*\S+\s*)?=\s*(?:\S|$)|^(?:pub\s+)?type\s+\w+.*=\s+\S')
+
+# How many lines, counting the body's last line, a body start may span
+BODY_WINDOW = 30
+
+# A line whose last non-space character does not terminate it
+UNTERMINATED_LINE_RE = re.compile(r"[^;}{,(\[|:\s][^\S\n]*$", re.MULTILINE)
+
+# Prefixes (after indentation) of lines that start a new declaration
+DECLARATION_PREFIXES = ("@", "pub @", "type ", "pub type ", "trait ", "impl ", "use ", "#")
+
+
+def declaration_context(lines):
+    """Flag the lines that may end an expression body needing `;`.
 
     Heuristic: a line that ends the body of a function/test/type declaration
-    (i.e., is followed by a blank line or end-of-file or next declaration)
-    and doesn't end with `}`, `;`, `{`, or `,`.
+    is within BODY_WINDOW lines of the `= ` that started that body. One
+    forward pass tracks the most recent body start, instead of walking the
+    window backward from every candidate line.
     """
-    line = lines[idx].rstrip()
-    if not line:
-        return False
-
-    last_char = line[-1]
-    if last_char in (';', '}', '{', ',', '(', '[', '|'):
-        return False
-
-    # Check if this line is within a declaration context
-    # Walk backward to find if there's an `= ` that started this body
-    for back in range(idx, max(idx - 30, -1), -1):
-        back_line = lines[back].rstrip()
-        if re.search(r'\)\s*->\s*\S+\s*=\s*\S', back_line):
-            return True
-        if re.search(r'\)\s*=\s*\S', back_line):
-            return True
-        # Multiline: `) -> Type = ` at end (body on next line)
-        if re.search(r'\)\s*->\s*\S+\s*=\s*$', back_line):
-            return True
-        if re.search(r'\)\s*=\s*$', back_line):
-            return True
-        # Sum type or newtype: `type X = expr`
-        if re.search(r'^(?:pub\s+)?type\s+\w+.*=\s+\S', back_line):
-            return True
-    return False
+    in_context = []
+    last_start = -BODY_WINDOW
+    for i, line in enumerate(lines):
+        if BODY_START_RE.search(line):
+            last_start = i
+        in_context.append(i - last_start < BODY_WINDOW)
+    return in_context
 
 
 def is_declaration_line(line):
     """Check if a line starts a new declaration."""
-    stripped = line.lstrip()
-    return (
-        stripped.startswith("@")
-        or stripped.startswith("pub @")
-        or stripped.startswith("type ")
-        or stripped.startswith("pub type ")
-        or stripped.startswith("trait ")
-        or stripped.startswith("impl ")
-        or stripped.startswith("use ")
-        or stripped.startswith("#")
-    )
+    return line.lstrip().startswith(DECLARATION_PREFIXES)
+
+
+def write_atomically(filepath, content):
+    """Replace filepath with content, so an interrupted write never truncates it."""
+    tmp_path = f"{filepath}.tmp"
+    with open(tmp_path, "w", buffering=IO_BUFFER_SIZE) as f:
+        f.write(content)
+    shutil.copymode(filepath, tmp_path)
+    os.replace(tmp_path, filepath)
 
 
 def process_expected_file(filepath):
     """Add missing `;` to expression bodies in a .expected file."""
-    with open(filepath, "r") as f:
+    with open(filepath, "r", buffering=IO_BUFFER_SIZE) as f:
         content = f.read()
 
+    # Files where every line is already terminated need no further scan
+    if not UNTERMINATED_LINE_RE.search(content):
+        return 0
+
     lines = content.split("\n")
+    in_context = declaration_context(lines)
     changes = 0
 
     for i in range(len(lines)):
@@ -109,32 +114,68 @@ def process_expected_file(filepath):
             continue
 
         # This line ends a body. Check if it's part of a declaration with `=`
-        if needs_semicolon_at_end(lines, i):
+        if in_context[i]:
             lines[i] = line + ";"
             changes += 1
 
     if changes > 0:
-        with open(filepath, "w") as f:
-            f.write("\n".join(lines))
-        print(f"  {filepath}: {changes} semicolons added")
+        write_atomically(filepath, "\n".join(lines))
 
     return changes
 
 
+def iter_files(root, suffixes):
+    """Yield paths of files under root whose names end with one of suffixes.
+
+    Like `os.walk`, symlinked directories are not descended into and
+    unreadable directories are skipped.
+    """
+    pending = [root]
+    while pending:
+        dirpath = pending.pop()
+        try:
+            entries = os.scandir(dirpath)
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir():
+                    if not entry.is_symlink():
+                        pending.append(entry.path)
+                elif entry.name.endswith(suffixes):
+                    yield entry.path
+
+
+def collect_files(paths):
+    """Collect .ori.expected files from paths (recursive for dirs).
+
+    Files under each directory are sorted by directory, then by name.
+    """
+    files = []
+    for path in paths:
+        if os.path.isfile(path) and path.endswith(".ori.expected"):
+            files.append(path)
+        elif os.path.isdir(path):
+            files.extend(sorted(iter_files(path, ".ori.expected"), key=os.path.split))
+    return files
+
+
 def main():
     if len(sys.argv) < 2:
         print("Usage: python3 scripts/regen_expected.py <path>...")
         sys.exit(1)
 
+    files = collect_files(sys.argv[1:])
+
+    # Files are independent, so process them across worker processes
+    with ProcessPoolExecutor() as pool:
+        counts = list(pool.map(process_expected_file, files, chunksize=32))
+
     total = 0
-    for path in sys.argv[1:]:
-        if os.path.isfile(path) and path.endswith(".ori.expected"):
-            total += process_expected_file(path)
-        elif os.path.isdir(path):
-            for root, _, files in sorted(os.walk(path)):
-                for fname in sorted(files):
-                    if fname.endswith(".ori.expected"):
-                        total += process_expected_file(os.path.join(root, fname))
+    for filepath, changes in zip(files, counts):
+        if changes > 0:
+            print(f"  {filepath}: {changes} semicolons added")
+        total += changes
 
     print(f"\nTotal: {total} semicolons added")
 
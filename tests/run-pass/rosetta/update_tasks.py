@@ -3,105 +3,272 @@
 Script to fetch Rosetta Code task details and update markdown files.
 
 Usage:
-    python update_tasks.py [start_num] [end_num] [--force] [--dry-run]
+    python update_tasks.py [start_num] [end_num] [--force] [--dry-run] [--no-cache]
+
+Fetched wiki text is cached in .cache/ for a day; --no-cache refetches every
+page and refreshes the cache.
 """
 
+import hashlib
+import http.client
 import json
 import re
 import sys
+import threading
 import time
-import urllib.request
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 TASKS_DIR = Path(__file__).parent / "_tasks"
-API_BASE = "https://rosettacode.org/w/api.php"
+API_HOST = "rosettacode.org"
+API_PATH = "/w/api.php"
+API_HEADERS = {"User-Agent": "Mozilla/5.0 (compatible; RosettaCodeFetcher/1.0)"}
+
+# Task files fetched concurrently; requests are still spaced by REQUEST_INTERVAL
+FETCH_THREADS = 8
+
+# Minimum seconds between the starts of any two API requests
+REQUEST_INTERVAL = 0.2
+
+# Most titles the MediaWiki query API accepts in one request
+API_TITLE_LIMIT = 50
+
+# Fetched wiki text, one file per title, reused for CACHE_TTL seconds
+CACHE_DIR = TASKS_DIR.parent / ".cache"
+CACHE_TTL = 24 * 60 * 60
+
+# Wiki markup patterns, compiled once and applied by clean_wiki_text in order
+TEMPLATE_BRACE_RE = re.compile(r'\{\{|\}\}')
+WIKI_LINK_RE = re.compile(r'\[\[(?:[^|\]]*\|)?([^\]]+)\]\]')
+EXTERNAL_LINK_TEXT_RE = re.compile(r'\[https?://[^\s\]]+ ([^\]]+)\]')
+EXTERNAL_LINK_BARE_RE = re.compile(r'\[https?://[^\]]+\]')
+BOLD_ITALIC_RE = re.compile(r"'{2,}")
+HTML_TAG_RE = re.compile(r'<[^>]+>')
+MATH_RE = re.compile(r'<math>[^<]*(?:<(?!/math>)[^<]*)*</math>')
+LATEX_MATHIT_RE = re.compile(r'\\mathit\{([^}]*)\}')
+LATEX_BRACE_RE = re.compile(r'\\[a-z]+\{[^}]*\}')
+LATEX_COMMAND_RE = re.compile(r'\\[a-z]+')
+DEFINITION_TERM_RE = re.compile(r'^;+\s*', re.MULTILINE)
+DEFINITION_INDENT_RE = re.compile(r'^:+\s*', re.MULTILINE)
+CATEGORY_RE = re.compile(r'Category:[^\n]+')
+ENTITY_RE = re.compile(r'&[a-z]+;')
+
+# Start of a section header, which ends the task description
+SECTION_HEADER_RE = re.compile(r'^==', re.MULTILINE)
+
+# Bullet items that are references rather than requirements
+REFERENCE_PREFIX_RE = re.compile(r'^(Wikipedia|OEIS|See also|Related)', re.I)
+PARENTHESIZED_TRAILER_RE = re.compile(r'\(.*\)$')
+
+# Bullet items that read like test cases
+TEST_CASE_WORDS_RE = re.compile(r'[→=]>|should|expect|result|output|returns?', re.I)
+TEST_CASE_ARITHMETIC_RE = re.compile(r'^\d+\s*[+\-*/×÷]|^\(?\d+,\s*\d+\)?.*[=→]')
+
+# Whitespace runs collapsed in the problem statement
+WHITESPACE_RE = re.compile(r'\s+')
+
+# Sentence boundary in the problem statement: whitespace after a sentence end,
+# but not after "e.g." or "i.e."
+SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?])(?<!e\.g\.)(?<!i\.e\.)\s+')
+
+# Sentences that sound like requirements
+REQUIREMENT_WORDS_RE = re.compile(r'must|should|need|require|implement|write|create|show|display|demonstrate', re.I)
+
+# First heading of a task file, naming the task
+HEADING_RE = re.compile(r"#\s*(.+)")
+
+# Number prefix of a task file name, as in 001_100_doors.md
+TASK_NUMBER_RE = re.compile(r"^(\d+)_")
 
 
-def fetch_wiki_text(title: str) -> str | None:
-    """Fetch raw wiki text using MediaWiki API."""
+class RateLimiter:
+    """Space out calls made from any number of threads."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.next_start = 0.0
+
+    def wait(self):
+        """Block until this caller's turn, at least `interval` after the last."""
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_start)
+            self.next_start = start + self.interval
+        time.sleep(start - now)
+
+
+api_rate_limit = RateLimiter(REQUEST_INTERVAL)
+
+# Each fetch thread keeps one connection alive across its requests
+api_connections = threading.local()
+
+
+def api_get(query: str) -> bytes:
+    """GET API_PATH?query over this thread's kept-alive connection."""
+    conn = getattr(api_connections, "conn", None)
+    reused = conn is not None
+    if not reused:
+        conn = api_connections.conn = http.client.HTTPSConnection(API_HOST, timeout=30)
+    try:
+        conn.request("GET", f"{API_PATH}?{query}", headers=API_HEADERS)
+        response = conn.getresponse()
+        body = response.read()
+    except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+        conn.close()
+        api_connections.conn = None
+        if not reused:
+            raise
+        # The server dropped the idle connection; retry once on a new one
+        return api_get(query)
+    except Exception:
+        conn.close()
+        api_connections.conn = None
+        raise
+    if response.status != 200:
+        raise OSError(f"HTTP Error {response.status}: {response.reason}")
+    return body
+
+
+def fetch_wiki_texts(titles: list[str]) -> dict[str, str]:
+    """Fetch the lead wiki text for up to API_TITLE_LIMIT titles using MediaWiki API.
+
+    Returns the text of each requested title whose page exists, keyed by the
+    title as requested. Network and HTTP errors raise, as does a response
+    without query results, such as an API error reported with status 200.
+    """
     params = {
         "action": "query",
-        "titles": title,
+        "titles": "|".join(titles),
         "prop": "revisions",
         "rvprop": "content",
         "rvslots": "main",
+        # Only the lead section: the task description precedes the first
+        # header, and the language implementations are the bulk of each page
+        "rvsection": "0",
         "format": "json",
     }
 
-    url = API_BASE + "?" + urllib.parse.urlencode(params)
+    canonical = {}
+    contents = {}
+    while True:
+        api_rate_limit.wait()
+        data = json.loads(api_get(urllib.parse.urlencode(params)))
+        if "error" in data:
+            error = data["error"]
+            raise OSError(f"{error.get('code')}: {error.get('info')}")
+        if "query" not in data:
+            raise OSError("response has no query results")
+        query = data["query"]
+        for entry in query.get("normalized", []):
+            canonical[entry["from"]] = entry["to"]
+        for page_data in query.get("pages", {}).values():
+            revisions = page_data.get("revisions", [])
+            if "missing" not in page_data and revisions:
+                contents[page_data["title"]] = revisions[0].get("slots", {}).get("main", {}).get("*", "")
+        # Large pages can push the rest of the batch into a continuation
+        if "continue" not in data:
+            break
+        params.update(data["continue"])
+
+    return {title: contents[canonical.get(title, title)] for title in titles if canonical.get(title, title) in contents}
+
+
+def cache_path(title: str) -> Path:
+    """Cache file holding the fetched wiki text for a title."""
+    return CACHE_DIR / hashlib.sha1(title.encode()).hexdigest()[:16]
+
 
+def read_cached_text(title: str) -> str | None:
+    """Cached wiki text for a title, or None if absent or stale.
+
+    A title whose page does not exist is cached as an empty string.
+    """
+    path = cache_path(title)
     try:
-        req = urllib.request.Request(
-            url,
-            headers={"User-Agent": "Mozilla/5.0 (compatible; RosettaCodeFetcher/1.0)"}
-        )
-        with urllib.request.urlopen(req, timeout=30) as response:
-            data = json.loads(response.read().decode("utf-8"))
-
-        pages = data.get("query", {}).get("pages", {})
-        for page_id, page_data in pages.items():
-            if page_id != "-1":
-                revisions = page_data.get("revisions", [])
-                if revisions:
-                    return revisions[0].get("slots", {}).get("main", {}).get("*", "")
-        return None
-    except Exception as e:
-        print(f"  API error: {e}")
-        return None
+        if time.time() - path.stat().st_mtime < CACHE_TTL:
+            return path.read_text()
+    except OSError:
+        pass
+    return None
+
+
+def write_cached_text(title: str, wiki_text: str):
+    """Cache fetched wiki text for a title."""
+    CACHE_DIR.mkdir(exist_ok=True)
+    cache_path(title).write_text(wiki_text)
+
+
+def strip_templates(text: str) -> str:
+    """Remove every {{...}} template, including nested ones, in one scan.
+
+    Unbalanced braces are kept as text; a template inside an unclosed one is
+    still removed.
+    """
+    # Spans of matched {{ }} pairs, outermost only, in text order
+    spans = []
+    opens = []
+    for m in TEMPLATE_BRACE_RE.finditer(text):
+        if m[0] == '{{':
+            opens.append(m.start())
+        elif opens:
+            start = opens.pop()
+            while spans and spans[-1][0] >= start:
+                spans.pop()
+            spans.append((start, m.end()))
+
+    parts = []
+    pos = 0
+    for start, end in spans:
+        parts.append(text[pos:start])
+        pos = end
+    parts.append(text[pos:])
+    return ''.join(parts)
 
 
 def clean_wiki_text(text: str) -> str:
     """Clean wiki markup from text."""
     # Remove templates like {{...}}
-    text = re.sub(r'\{\{[^}]*\}\}', '', text)
+    text = strip_templates(text)
     # Remove wiki links, keep text: [[link|text]] -> text, [[link]] -> link
-    text = re.sub(r'\[\[(?:[^|\]]*\|)?([^\]]+)\]\]', r'\1', text)
+    text = WIKI_LINK_RE.sub(r'\1', text)
     # Remove external links [url text] -> text
-    text = re.sub(r'\[https?://[^\s\]]+ ([^\]]+)\]', r'\1', text)
-    text = re.sub(r'\[https?://[^\]]+\]', '', text)
+    text = EXTERNAL_LINK_TEXT_RE.sub(r'\1', text)
+    text = EXTERNAL_LINK_BARE_RE.sub('', text)
     # Remove bold/italic
-    text = re.sub(r"'{2,}", '', text)
+    text = BOLD_ITALIC_RE.sub('', text)
     # Remove HTML tags
-    text = re.sub(r'<[^>]+>', '', text)
+    text = HTML_TAG_RE.sub('', text)
     # Remove math tags content
-    text = re.sub(r'<math>.*?</math>', '', text, flags=re.DOTALL)
+    text = MATH_RE.sub('', text)
     # Remove LaTeX-style math
-    text = re.sub(r'\\mathit\{([^}]*)\}', r'\1', text)
-    text = re.sub(r'\\[a-z]+\{[^}]*\}', '', text)
-    text = re.sub(r'\\[a-z]+', '', text)
+    text = LATEX_MATHIT_RE.sub(r'\1', text)
+    text = LATEX_BRACE_RE.sub('', text)
+    text = LATEX_COMMAND_RE.sub('', text)
     # Remove wiki definition markers
-    text = re.sub(r'^;+\s*', '', text, flags=re.MULTILINE)
-    text = re.sub(r'^:+\s*', '', text, flags=re.MULTILINE)
+    text = DEFINITION_TERM_RE.sub('', text)
+    text = DEFINITION_INDENT_RE.sub('', text)
     # Remove category tags
-    text = re.sub(r'Category:[^\n]+', '', text)
+    text = CATEGORY_RE.sub('', text)
     # Remove &nbsp; and similar
-    text = re.sub(r'&[a-z]+;', ' ', text)
-    # Clean whitespace
-    text = re.sub(r'\n{3,}', '\n\n', text)
-    text = re.sub(r' +', ' ', text)
+    text = ENTITY_RE.sub(' ', text)
+    # Clean whitespace: collapse blank line runs to one and space runs to one space
+    while '\n\n\n' in text:
+        text = text.replace('\n\n\n', '\n\n')
+    while '  ' in text:
+        text = text.replace('  ', ' ')
     return text.strip()
 
 
 def extract_task_section(wiki_text: str) -> str:
     """Extract just the task description section (before language implementations)."""
-    # Task content is before the first ==Language== header
-    # Look for common section markers
-    patterns = [
-        r'^==\s*\w',  # ==SomeLanguage or ==See also
-        r'^=={{header',  # =={{header|Language}}
-    ]
-
-    lines = wiki_text.split('\n')
-    task_lines = []
-
-    for line in lines:
-        # Stop at first language header or see also
-        if re.match(r'^==', line):
-            break
-        task_lines.append(line)
-
-    return '\n'.join(task_lines)
+    # Task content is before the first ==Language== header (or ==See also)
+    match = SECTION_HEADER_RE.search(wiki_text)
+    if not match:
+        return wiki_text
+    # Drop the newline that ends the last description line
+    return wiki_text[:max(match.start() - 1, 0)]
 
 
 def parse_task_content(task_text: str) -> dict:
@@ -110,6 +277,8 @@ def parse_task_content(task_text: str) -> dict:
     lines = cleaned.split('\n')
 
     problem_parts = []
+    # Length of ' '.join(problem_parts), kept as a running total
+    problem_len = 0
     requirements = []
     test_cases = []
 
@@ -127,41 +296,43 @@ def parse_task_content(task_text: str) -> dict:
             item = line.lstrip('*#:').strip()
             if item and len(item) > 5:
                 # Skip "See also" style links and references
-                if re.search(r'^(Wikipedia|OEIS|See also|Related)', item, re.I):
+                if REFERENCE_PREFIX_RE.search(item):
                     continue
-                if re.search(r'\(.*\)$', item) and len(item) < 50:  # Likely a reference
+                if PARENTHESIZED_TRAILER_RE.search(item) and len(item) < 50:  # Likely a reference
                     continue
                 # Check if it looks like a test case
-                if re.search(r'[→=]>|should|expect|result|output|returns?', item, re.I):
+                if TEST_CASE_WORDS_RE.search(item):
                     test_cases.append(item)
-                elif re.search(r'^\d+\s*[+\-*/×÷]|^\(?\d+,\s*\d+\)?.*[=→]', item):
+                elif TEST_CASE_ARITHMETIC_RE.search(item):
                     test_cases.append(item)
                 else:
                     requirements.append(item)
         else:
             # Regular paragraph - part of problem description
-            if len(' '.join(problem_parts)) < 500 and len(line) > 10:
+            if problem_len < 500 and len(line) > 10:
+                problem_len += len(line) + (1 if problem_parts else 0)
                 problem_parts.append(line)
 
     # Build problem statement
     problem = ' '.join(problem_parts)
 
     # Clean up problem text
-    problem = re.sub(r'\s+', ' ', problem).strip()
+    problem = WHITESPACE_RE.sub(' ', problem).strip()
 
-    # Truncate if too long
+    # Truncate if too long, at the last sentence end within 500 characters
+    # unless that would keep only half of them
     if len(problem) > 500:
-        problem = problem[:500]
-        last_period = problem.rfind('.')
-        if last_period > 250:
-            problem = problem[:last_period + 1]
+        cut = 500
+        for m in SENTENCE_SPLIT_RE.finditer(problem, 252, 501):
+            cut = m.start()
+        problem = problem[:cut]
 
     # If we didn't find bullet requirements, try to extract from problem
     if not requirements and problem:
         # Look for sentences that sound like requirements
-        sentences = re.split(r'(?<=[.!])\s+', problem)
+        sentences = SENTENCE_SPLIT_RE.split(problem)
         for s in sentences[1:]:  # Skip first sentence (usually the main description)
-            if re.search(r'must|should|need|require|implement|write|create|show|display|demonstrate', s, re.I):
+            if REQUIREMENT_WORDS_RE.search(s):
                 requirements.append(s)
 
     return {
@@ -202,70 +373,72 @@ def format_markdown(task_name: str, info: dict) -> str:
     return "\n".join(lines)
 
 
-def is_file_incomplete(filepath: Path) -> bool:
-    """Check if a task file needs updating."""
+def read_task_file(filepath: Path) -> str | None:
+    """Read a task file, or return None if it cannot be read."""
     try:
-        content = filepath.read_text()
-        # Consider incomplete if very short or has placeholder text
-        if len(content.strip()) < 100:
-            return True
-        if "Complete the task as specified on Rosetta Code" in content:
-            return True
-        if "**Problem:**" not in content:
-            return True
-        return False
+        return filepath.read_text()
     except Exception:
+        return None
+
+
+def is_file_incomplete(content: str | None) -> bool:
+    """Check if a task file's content needs updating."""
+    # Consider incomplete if unreadable, very short or has placeholder text
+    if content is None or len(content.strip()) < 100:
+        return True
+    if "Complete the task as specified on Rosetta Code" in content:
         return True
+    if "**Problem:**" not in content:
+        return True
+    return False
 
 
-def get_task_name_from_file(filepath: Path) -> str:
-    """Extract task name from the file's first heading."""
-    try:
-        content = filepath.read_text()
-        match = re.match(r"#\s*(.+)", content)
+def get_task_name_from_file(filepath: Path, content: str | None) -> str:
+    """Extract task name from the file's first heading, else from its name."""
+    if content is not None:
+        match = HEADING_RE.match(content)
         if match:
             return match.group(1).strip()
-    except Exception:
-        pass
     name = filepath.stem
-    name = re.sub(r"^\d+_", "", name)
+    name = TASK_NUMBER_RE.sub("", name)
     return name.replace("_", " ")
 
 
-def process_file(filepath: Path, dry_run: bool = False) -> bool:
-    """Process a single task file."""
-    task_name = get_task_name_from_file(filepath)
-    print(f"Processing: {filepath.name}")
-
-    # Try different title variations
-    titles = [
+def title_variants(task_name: str) -> list[str]:
+    """Page titles to try for a task, in order of preference."""
+    return [
         task_name.replace(" ", "_"),
         task_name.replace(" ", "_").replace("-", "_"),
         task_name.replace("-", " ").replace(" ", "_"),
     ]
 
-    wiki_text = None
+
+def pick_wiki_text(titles: list[str], wiki_texts: dict[str, str]) -> str | None:
+    """Text of the first title with a substantial page, else of the last title."""
     for title in titles:
-        wiki_text = fetch_wiki_text(title)
+        wiki_text = wiki_texts.get(title)
         if wiki_text and len(wiki_text) > 100:
             break
-        time.sleep(0.2)
+    return wiki_text
 
+
+def process_file(filepath: Path, task_name: str, wiki_text: str | None, log: list[str], dry_run: bool = False) -> bool:
+    """Process a single task file from its fetched wiki text, appending progress messages to log."""
     if not wiki_text:
-        print(f"  Could not fetch: {task_name}")
+        log.append(f"  Could not fetch: {task_name}")
         info = {"problem": f"Implement the {task_name} task."}
     else:
         task_section = extract_task_section(wiki_text)
         info = parse_task_content(task_section)
-        print(f"  Found: {len(info.get('requirements', []))} reqs, {len(info.get('test_cases', []))} tests")
+        log.append(f"  Found: {len(info.get('requirements', []))} reqs, {len(info.get('test_cases', []))} tests")
 
     markdown = format_markdown(task_name, info)
 
     if dry_run:
-        print(f"---\n{markdown}\n---")
+        log.append(f"---\n{markdown}\n---")
     else:
         filepath.write_text(markdown)
-        print(f"  Updated")
+        log.append(f"  Updated")
 
     return True
 
@@ -278,6 +451,7 @@ def main():
     end_num = int(nums[1]) if len(nums) > 1 else None
     dry_run = "--dry-run" in args
     force = "--force" in args
+    use_cache = "--no-cache" not in args
 
     task_files = sorted(TASKS_DIR.glob("*.md"))
 
@@ -285,30 +459,62 @@ def main():
     if start_num is not None:
         filtered = []
         for f in task_files:
-            match = re.match(r"(\d+)_", f.name)
+            match = TASK_NUMBER_RE.match(f.name)
             if match:
                 num = int(match.group(1))
                 if start_num <= num <= (end_num or 9999):
                     filtered.append(f)
         task_files = filtered
 
+    # Read each file once, for both the completeness check and the task name
+    contents = {f: read_task_file(f) for f in task_files}
+
     # Filter to incomplete unless --force
     if not force:
-        task_files = [f for f in task_files if is_file_incomplete(f)]
+        task_files = [f for f in task_files if is_file_incomplete(contents[f])]
 
     print(f"Processing {len(task_files)} files")
     if dry_run:
         print("(DRY RUN)")
     print()
 
+    task_names = {f: get_task_name_from_file(f, contents[f]) for f in task_files}
+    variants = {f: title_variants(task_names[f]) for f in task_files}
+    titles = list(dict.fromkeys(t for ts in variants.values() for t in ts))
+
+    wiki_texts = {}
+    if use_cache:
+        for title in titles:
+            cached = read_cached_text(title)
+            if cached is not None:
+                wiki_texts[title] = cached
+    titles = [t for t in titles if t not in wiki_texts]
+
+    # Fetch every remaining candidate title up front, API_TITLE_LIMIT per
+    # request, with the batches overlapped across threads
+    batches = [titles[i:i + API_TITLE_LIMIT] for i in range(0, len(titles), API_TITLE_LIMIT)]
+    api_errors = {}
+    with ThreadPoolExecutor(max_workers=FETCH_THREADS) as pool:
+        futures = [(batch, pool.submit(fetch_wiki_texts, batch)) for batch in batches]
+        for batch, future in futures:
+            try:
+                fetched = future.result()
+            except Exception as e:
+                api_errors.update(dict.fromkeys(batch, f"  API error: {e}"))
+                continue
+            wiki_texts.update(fetched)
+            for title in batch:
+                write_cached_text(title, fetched.get(title, ""))
+
     success = 0
-    for filepath in task_files:
+    for f in task_files:
+        log = [f"Processing: {f.name}"]
+        log.extend(api_errors[t] for t in variants[f] if t in api_errors)
         try:
-            if process_file(filepath, dry_run):
-                success += 1
+            success += process_file(f, task_names[f], pick_wiki_text(variants[f], wiki_texts), log, dry_run)
         except Exception as e:
-            print(f"  Error: {e}")
-        time.sleep(0.5)
+            log.append(f"  Error: {e}")
+        print("\n".join(log))
 
     print(f"\nDone: {success}/{len(task_files)}")
 